@@ -1,27 +1,54 @@
 import streamlit as st
-import tensorflow as tf
 import numpy as np
 from PIL import Image
 import json
 import os
+import io
 import base64
 from db_module_1 import Database
+from model_registry import registry as model_registry
+from prediction_cache import prediction_cache
+from file_cache import file_cache
+from figure_cache import history_figure_cache
+from serving_config import load_serving_config
+from inference_worker import get_inference_pool
+from batching import get_batch_scheduler, get_scheduler_metrics
+from tflite_backend import get_serving_model_path
+from image_quality import check_image_quality
 from utils import (
-    save_uploaded_file,
-    preprocess_image,
+    save_uploaded_file_async,
+    restore_uploaded_file,
+    load_uploaded_image,
+    image_to_model_input,
+    get_enhanced_image,
+    StageTimer,
+    release_uploaded_file,
+    compute_content_hash,
+    get_thumbnail,
     plot_prediction_confidence,
     plot_prediction_history,
     format_date,
-    get_class_color
+    get_class_color,
+    CLASS_NAMES,
+    IMAGE_SIZE
 )
 
 # Initialize database
 db = Database()
 
+# Start loading the model in the background while the user logs in
+SERVING_CONFIG = load_serving_config()
+SERVING_MODEL_PATH = get_serving_model_path(SERVING_CONFIG['inference'])
+ENHANCE_IMAGES = SERVING_CONFIG['preprocessing']['enhance']
+if SERVING_CONFIG['inference']['mode'] == 'worker':
+    get_inference_pool()
+else:
+    model_registry.preload(SERVING_MODEL_PATH)
+
 # Constants
 IMAGE_HEIGHT = 150
 IMAGE_WIDTH = 150
-CLASS_NAMES = ['Mild', 'Moderate', 'Severe', 'Proliferative DR']
+HISTORY_PAGE_SIZE = 10
 
 
 # ===== STYLING FUNCTIONS =====
@@ -364,10 +391,10 @@ div.stTextInput > div > div > input:focus {
   }
 }
             """)
-
-    with open(css_file, "r") as f:
-        css = f"<style>{f.read()}</style>"
-        st.markdown(css, unsafe_allow_html=True)
+    
+    # Rebuilt only when styles.css changes on disk
+    css = file_cache.get(css_file, lambda text: f"<style>{text}</style>")
+    st.markdown(css, unsafe_allow_html=True)
     
     # Set page configuration
     st.markdown("""
@@ -391,26 +418,22 @@ def load_google_fonts():
 
 # ===== HELPER FUNCTIONS =====
 def load_model():
-    """Load or create model for prediction"""
+    """Return the shared, warmed-up model (or inference worker pool) for prediction"""
     try:
-        if not os.path.exists('model'):
-            os.makedirs('model')
-        
-        model_path = 'model/model.h5'
-        # Check if model exists, if not, create a placeholder
-        if not os.path.exists(model_path):
-            model = tf.keras.Sequential([
-                tf.keras.layers.InputLayer(input_shape=(IMAGE_HEIGHT, IMAGE_WIDTH, 3)),
-                tf.keras.layers.Conv2D(16, 3, padding='same', activation='relu'),
-                tf.keras.layers.MaxPooling2D(),
-                tf.keras.layers.Flatten(),
-                tf.keras.layers.Dense(4, activation='softmax')
-            ])
-            model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-            model.save(model_path)
-        else:
-            model = tf.keras.models.load_model(model_path)
-        return model
+        if SERVING_CONFIG['inference']['mode'] == 'worker':
+            pool = get_inference_pool()
+            if not pool.wait_until_ready(SERVING_CONFIG['inference']['request_timeout_s']):
+                raise RuntimeError("Inference workers did not start in time")
+            return pool
+        if SERVING_CONFIG['inference']['mode'] == 'batched':
+            # Make sure the model is loaded before requests start queueing
+            model_registry.get(SERVING_MODEL_PATH)
+            return get_batch_scheduler(
+                SERVING_MODEL_PATH,
+                SERVING_CONFIG['inference']['max_batch_size'],
+                SERVING_CONFIG['inference']['max_wait_ms']
+            )
+        return model_registry.get(SERVING_MODEL_PATH)
     except Exception as e:
         st.error(f"Error loading model: {str(e)}")
         return None
@@ -429,14 +452,42 @@ def load_remedies_data():
             }
             with open(remedies_path, 'w') as f:
                 json.dump(remedies_data, f)
-        else:
-            with open(remedies_path, 'r') as file:
-                remedies_data = json.load(file)
-        return remedies_data
+        # Reparsed only when the file changes; the dict is shared, so don't modify it
+        return file_cache.get(remedies_path, json.loads)
     except Exception as e:
         st.error(f"Error loading remedies data: {str(e)}")
         return {}
 
+def get_remedy(remedies_data, predicted_class):
+    """Return the recommended actions for one class from the loaded remedies"""
+    return remedies_data.get(predicted_class, 'No specific recommendations available.')
+
+
+def reset_history_pages():
+    """Forget loaded History pages so the next visit starts from the newest scan"""
+    for key in ('history_rows', 'history_has_more', 'history_user_id'):
+        st.session_state.pop(key, None)
+
+def load_history_page(user_id):
+    """Append the next page of predictions after the last loaded one"""
+    rows = st.session_state.setdefault('history_rows', [])
+    after = (rows[-1]['timestamp'], rows[-1]['id']) if rows else None
+    
+    # Fetch one extra row to know whether another page exists
+    page = db.get_user_predictions(user_id, after=after, limit=HISTORY_PAGE_SIZE + 1)
+    rows.extend(page[:HISTORY_PAGE_SIZE])
+    st.session_state.history_has_more = len(page) > HISTORY_PAGE_SIZE
+
+def get_model_fingerprint():
+    """Key for cached predictions: the model file, plus whether inputs are enhanced"""
+    model_fingerprint = model_registry.fingerprint(SERVING_MODEL_PATH)
+    return f"{model_fingerprint}+enhanced" if ENHANCE_IMAGES else model_fingerprint
+
+def show_quality_rejection(issues, name=None):
+    """Explain why an image failed the quality check instead of analyzing it"""
+    subject = f"**{name}** was not analyzed" if name else "This image was not analyzed"
+    st.error(f"{subject}: {'; '.join(issues)}. Please upload a clear, well-lit retinal fundus photo.")
+
 
 # ===== AUTHENTICATION PAGES =====
 def login_form():
@@ -536,12 +587,160 @@ def auth_page():
 
 
 # ===== MAIN APPLICATION PAGES =====
+def batch_analysis_section(remedies_data):
+    """Render multi-image upload with a single batched analysis pass"""
+    uploaded_files = st.file_uploader(
+        "Choose retinal images to analyze",
+        type=["jpg", "jpeg", "png"],
+        accept_multiple_files=True,
+        key="batch_uploader"
+    )
+    
+    if not uploaded_files:
+        return
+    
+    st.caption(f"{len(uploaded_files)} images selected")
+    analyze_button = st.button("Analyze All Images", use_container_width=True)
+    
+    if not analyze_button:
+        return
+    
+    # Unusable photos are reported and dropped before anything is saved or scored
+    timer = StageTimer()
+    accepted = []
+    previews = []
+    for uploaded_file in uploaded_files:
+        with timer.stage("decode"):
+            original_size = Image.open(io.BytesIO(uploaded_file.getvalue())).size
+            preview = load_uploaded_image(uploaded_file)
+        with timer.stage("quality check"):
+            quality = check_image_quality(preview, original_size)
+        if quality['passed']:
+            accepted.append(uploaded_file)
+            previews.append(preview)
+        else:
+            show_quality_rejection(quality['issues'], uploaded_file.name)
+    uploaded_files = accepted
+    
+    # The model (and TensorFlow) is only needed once analysis is requested
+    if uploaded_files and (model := load_model()) is not None:
+        with st.spinner(f"Analyzing {len(uploaded_files)} retinal images..."):
+            image_hashes = [compute_content_hash(uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+            
+            # Files are written in the background while the model runs
+            saves = [
+                save_uploaded_file_async(uploaded_file, image_hash)
+                for uploaded_file, image_hash in zip(uploaded_files, image_hashes)
+            ]
+            image_paths = [image_path for image_path, _ in saves]
+            model_fingerprint = get_model_fingerprint()
+            
+            # Only images without a cached result go through the model
+            predictions = np.empty((len(image_paths), len(CLASS_NAMES)), dtype=np.float32)
+            missing = []
+            for i, image_hash in enumerate(image_hashes):
+                cached = prediction_cache.get(db, image_hash, model_fingerprint)
+                if cached is not None:
+                    predictions[i] = cached
+                else:
+                    missing.append(i)
+            
+            # Preprocess the rest from the decoded previews and score them in one forward pass
+            if missing:
+                img_batch = np.empty((len(missing), IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+                for row, i in enumerate(missing):
+                    if ENHANCE_IMAGES:
+                        with timer.stage("enhancement"):
+                            model_image = get_enhanced_image(previews[i], image_hashes[i])
+                    else:
+                        model_image = previews[i]
+                    with timer.stage("preprocessing"):
+                        image_to_model_input(model_image, out=img_batch[row])
+                with timer.stage("inference"):
+                    predictions[missing] = model.predict(img_batch, batch_size=len(missing), verbose=0)
+                for i in missing:
+                    prediction_cache.put(db, image_hashes[i], model_fingerprint, predictions[i])
+            
+            # Result cards show the stored thumbnails, so let the writes finish;
+            # images that could not be stored are scored but not recorded
+            stored = []
+            with timer.stage("saving"):
+                for uploaded_file, (_, write) in zip(uploaded_files, saves):
+                    try:
+                        write.result()
+                        stored.append(True)
+                    except Exception as e:
+                        st.error(f"Error saving {uploaded_file.name}, its result was not recorded: {str(e)}")
+                        stored.append(False)
+            
+            class_indices = np.argmax(predictions, axis=1)
+            confidences = predictions[np.arange(len(predictions)), class_indices]
+            
+            results = [
+                (image_path, CLASS_NAMES[class_index], float(confidence))
+                for image_path, class_index, confidence in zip(image_paths, class_indices, confidences)
+            ]
+            
+            # Save the stored images' predictions in one transaction, with their full probability vectors
+            with timer.stage("saving"):
+                saved = db.save_predictions(
+                    st.session_state.user['id'],
+                    [
+                        result + (probabilities.tobytes(),)
+                        for result, probabilities, ok in zip(results, predictions, stored) if ok
+                    ],
+                    model_version=model_fingerprint
+                )
+            if saved:
+                # A delete may have released a file before its row was committed
+                for uploaded_file, image_path, ok in zip(uploaded_files, image_paths, stored):
+                    if ok:
+                        restore_uploaded_file(uploaded_file, image_path)
+            else:
+                st.error("Failed to save batch results.")
+            reset_history_pages()
+            history_figure_cache.invalidate(st.session_state.user['id'])
+        
+        st.markdown('<div class="card">', unsafe_allow_html=True)
+        st.markdown('<div class="card-header">Batch Results</div>', unsafe_allow_html=True)
+        st.caption(f"Processing time: {timer.summary()}")
+        
+        st.dataframe(
+            [
+                {
+                    "Image": uploaded_file.name,
+                    "Detected Class": predicted_class,
+                    "Confidence": f"{confidence:.2%}"
+                }
+                for uploaded_file, (_, predicted_class, confidence) in zip(uploaded_files, results)
+            ],
+            use_container_width=True
+        )
+        
+        for i, (uploaded_file, (image_path, predicted_class, confidence)) in enumerate(zip(uploaded_files, results)):
+            with st.expander(f"{uploaded_file.name} - {predicted_class} ({confidence:.2%})"):
+                col1, col2 = st.columns([1, 2])
+                
+                with col1:
+                    st.image(get_thumbnail(image_path) if stored[i] else previews[i], caption="Retinal Image", use_column_width=True)
+                
+                with col2:
+                    st.markdown(f"""
+                    <div class="info-card">
+                        <h3>Recommended Actions</h3>
+                        <p>{get_remedy(remedies_data, predicted_class)}</p>
+                    </div>
+                    """, unsafe_allow_html=True)
+                    fig = plot_prediction_confidence(predictions[i:i + 1], CLASS_NAMES)
+                    st.plotly_chart(fig, use_container_width=True, key=f"batch_chart_{i}")
+        
+        st.markdown('</div>', unsafe_allow_html=True)  # Close results card
+
 def home_page():
     """Render home page with upload and analysis functionality"""
-    # Load styles, model and data
+    # Load styles and data; the model is fetched when analysis starts
     load_css()
     load_google_fonts()
-    model = load_model()
     remedies_data = load_remedies_data()
     
     # Main header
@@ -556,11 +755,22 @@ def home_page():
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown('<div class="card-header">Upload Retinal Image</div>', unsafe_allow_html=True)
     
-    uploaded_file = st.file_uploader("Choose a retinal image to analyze", type=["jpg", "jpeg", "png"])
+    analysis_mode = st.radio(
+        "Analysis mode",
+        ["Single image", "Batch (multiple images)"],
+        horizontal=True
+    )
+    
+    if analysis_mode == "Single image":
+        uploaded_file = st.file_uploader("Choose a retinal image to analyze", type=["jpg", "jpeg", "png"])
+    else:
+        batch_analysis_section(remedies_data)
+        uploaded_file = None
     
     if uploaded_file is not None:
-        # Display the uploaded image and guidelines
-        image_display = Image.open(uploaded_file)
+        # Display a downscaled preview of the uploaded image and guidelines
+        image_display = load_uploaded_image(uploaded_file)
+        original_size = Image.open(io.BytesIO(uploaded_file.getvalue())).size
         
         col1, col2 = st.columns([1, 1])
         
@@ -585,29 +795,67 @@ def home_page():
         # Analysis button
         analyze_button = st.button("Analyze Image", use_container_width=True)
         
-        if analyze_button and model is not None:
+        # Unusable photos are turned away before the model or database is touched
+        timer = StageTimer()
+        if analyze_button:
+            with timer.stage("quality check"):
+                quality = check_image_quality(image_display, original_size)
+        
+        if analyze_button and not quality['passed']:
+            show_quality_rejection(quality['issues'])
+        elif analyze_button and (model := load_model()) is not None:
             with st.spinner("Analyzing retinal image..."):
                 # Process image and make prediction
-                image_path = save_uploaded_file(uploaded_file)
-                img_array = preprocess_image(image_path)
+                # Persist in the background; everything below works from memory
+                image_hash = compute_content_hash(uploaded_file.getvalue())
+                image_path, write = save_uploaded_file_async(uploaded_file, image_hash)
+                model_fingerprint = get_model_fingerprint()
+                
+                # Reuse the stored result if this image was already scored by this model
+                cached = prediction_cache.get(db, image_hash, model_fingerprint)
+                if cached is not None:
+                    prediction = cached[np.newaxis, :]
+                else:
+                    if ENHANCE_IMAGES:
+                        with timer.stage("enhancement"):
+                            model_image = get_enhanced_image(image_display, image_hash)
+                    else:
+                        model_image = image_display
+                    with timer.stage("preprocessing"):
+                        img_array = image_to_model_input(model_image)[np.newaxis]
+                    with timer.stage("inference"):
+                        prediction = model.predict(img_array)
+                    prediction_cache.put(db, image_hash, model_fingerprint, prediction[0])
                 
-                prediction = model.predict(img_array)
                 predicted_class_index = np.argmax(prediction)
                 predicted_class = CLASS_NAMES[predicted_class_index]
                 confidence = float(prediction[0][predicted_class_index])
                 
-                # Save prediction to database
-                db.save_prediction(
-                    st.session_state.user['id'],
-                    image_path,
-                    predicted_class,
-                    confidence
-                )
+                # Save prediction to database once the image it points at is on disk
+                with timer.stage("saving"):
+                    try:
+                        write.result()
+                    except Exception as e:
+                        st.error(f"Error saving image, the result was not recorded: {str(e)}")
+                    else:
+                        db.save_prediction(
+                            st.session_state.user['id'],
+                            image_path,
+                            predicted_class,
+                            confidence,
+                            probabilities=np.asarray(prediction[0], dtype=np.float32).tobytes(),
+                            model_version=model_fingerprint
+                        )
+                        # A delete may have released the file before the row was committed
+                        restore_uploaded_file(uploaded_file, image_path)
+                        reset_history_pages()
+                        history_figure_cache.invalidate(st.session_state.user['id'])
                 
                 # Display results
             
                 st.markdown('<div class="card">', unsafe_allow_html=True)
                 st.markdown('<div class="card-header">Prediction Results</div>', unsafe_allow_html=True)
+                st.caption(f"Processing time: {timer.summary()}")
                 
                 # Format severity class for styling
                 severity_class = predicted_class.lower().replace(" ", "-")
@@ -630,7 +878,7 @@ def home_page():
                     st.markdown(f"""
                     <div class="info-card">
                         <h3>Recommended Actions</h3>
-                        <p>{remedies_data.get(predicted_class, 'No specific recommendations available.')}</p>
+                        <p>{get_remedy(remedies_data, predicted_class)}</p>
                     </div>
                     """, unsafe_allow_html=True)
                 
@@ -718,14 +966,15 @@ def history_page():
     </div>
     """, unsafe_allow_html=True)
     
-    # Get user's predictions
-    predictions = db.get_user_predictions(st.session_state.user['id'])
+    # Get user's summary metrics
+    user_id = st.session_state.user['id']
+    summary = db.get_user_summary(user_id)
     
     # History summary card
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown('<div class="card-header">History Summary</div>', unsafe_allow_html=True)
     
-    if not predictions:
+    if summary['total_scans'] == 0:
         st.markdown("""
         <div class="no-data">
             <div class="no-data-icon">📊</div>
@@ -739,26 +988,25 @@ def history_page():
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            st.metric("Total Scans", len(predictions))
+            st.metric("Total Scans", summary['total_scans'])
         
-        # Calculate most recent prediction date
-        if predictions:
-            most_recent = max(pred['timestamp'] for pred in predictions)
-            with col2:
-                st.metric("Last Scan", format_date(most_recent))
+        with col2:
+            st.metric("Last Scan", format_date(summary['last_timestamp']))
         
         # Count by severity
-        severity_counts = {}
-        for class_name in CLASS_NAMES:
-            severity_counts[class_name] = sum(1 for pred in predictions if pred['predicted_class'] == class_name)
+        severity_counts = summary['class_counts']
         
         with col3:
-            highest_severity = max(CLASS_NAMES, key=lambda c: severity_counts[c])
+            highest_severity = max(CLASS_NAMES, key=lambda c: severity_counts.get(c, 0))
             st.metric("Most Common Result", highest_severity)
         
         # Plot prediction history
         st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-        fig = plot_prediction_history(predictions, CLASS_NAMES)
+        fig = history_figure_cache.get(
+            user_id,
+            (summary['total_scans'], summary['last_timestamp']),
+            lambda: plot_prediction_history(db.get_user_predictions(user_id), CLASS_NAMES)
+        )
         st.plotly_chart(fig, use_container_width=True)
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -768,22 +1016,27 @@ def history_page():
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown('<div class="card-header">Detailed History</div>', unsafe_allow_html=True)
     
-    if not predictions:
+    # Load the first page on arrival; later pages only when requested
+    if st.session_state.get('history_user_id') != user_id:
+        reset_history_pages()
+        st.session_state.history_user_id = user_id
+    if 'history_rows' not in st.session_state:
+        load_history_page(user_id)
+    
+    loaded_predictions = st.session_state.history_rows
+    
+    if not loaded_predictions:
         st.info("No prediction records found.")
     else:
-        # Sort predictions by timestamp (newest first)
-        sorted_predictions = sorted(predictions, key=lambda x: x['timestamp'], reverse=True)
-        
-        for i, pred in enumerate(sorted_predictions):
+        for i, pred in enumerate(loaded_predictions):
             # Create expandable section for each prediction
             with st.expander(f"Scan #{i+1} - {format_date(pred['timestamp'])}", expanded=i==0):
                 col1, col2 = st.columns([1, 2])
                 
                 with col1:
-                    # Display the image
+                    # Display the stored thumbnail rather than the full-resolution original
                     try:
-                        image = Image.open(pred['image_path'])
-                        st.image(image, caption="Retinal Image", use_column_width=True)
+                        st.image(get_thumbnail(pred['image_path']), caption="Retinal Image", use_column_width=True)
                     except Exception as e:
                         st.error(f"Error loading image: {str(e)}")
                 
@@ -806,27 +1059,40 @@ def history_page():
                     st.markdown(f"""
                     <div class="info-card">
                         <h3>Recommended Actions</h3>
-                        <p>{remedies_data.get(pred['predicted_class'], 'No specific recommendations available.')}</p>
+                        <p>{get_remedy(remedies_data, pred['predicted_class'])}</p>
                     </div>
                     """, unsafe_allow_html=True)
+                    
+                    # Redraw the confidence chart from the stored probabilities; older records have none
+                    if pred.get('probabilities'):
+                        probabilities = np.frombuffer(pred['probabilities'], dtype=np.float32)
+                        fig = plot_prediction_confidence(probabilities[np.newaxis], CLASS_NAMES)
+                        st.plotly_chart(fig, use_container_width=True, key=f"history_chart_{pred['id']}")
                 
-                # Action buttons
                 # Action buttons
                 col1, col2 = st.columns([1, 1])
                 
                 with col1:
-                    if st.button(f"Download Report", key=f"download_{i}", use_container_width=True):
+                    if st.button(f"Download Report", key=f"download_{pred['id']}", use_container_width=True):
                         # Generate and download report logic here
                         st.info("Report download feature will be implemented soon.")
                 
                 with col2:
-                    if st.button(f"Delete Record", key=f"delete_{i}", use_container_width=True):
+                    if st.button(f"Delete Record", key=f"delete_{pred['id']}", use_container_width=True):
                         # Delete record logic
                         if db.delete_prediction(pred['id']):
+                            db.release_image(pred['image_path'], release_uploaded_file)
+                            loaded_predictions.remove(pred)
+                            history_figure_cache.invalidate(user_id)
                             st.success("Record deleted successfully!")
-                            st.experimental_rerun()
+                            st.rerun()
                         else:
                             st.error("Failed to delete record.")
+        
+        if st.session_state.history_has_more:
+            if st.button("Load More", use_container_width=True):
+                load_history_page(user_id)
+                st.rerun()
     
     st.markdown('</div>', unsafe_allow_html=True)  # Close detailed history card
 
@@ -936,11 +1202,15 @@ def profile_page():
             
             if confirm_delete and st.button("Confirm Delete"):
                 # Delete account logic
+                image_paths = {pred['image_path'] for pred in db.get_user_predictions(user['id'])}
                 if db.delete_user(user['id']):
+                    history_figure_cache.invalidate(user['id'])
+                    for image_path in image_paths:
+                        db.release_image(image_path, release_uploaded_file)
                     st.session_state.clear()
                     st.session_state.page = 'login'
                     st.success("Account deleted successfully.")
-                    st.experimental_rerun()
+                    st.rerun()
                 else:
                     st.error("Failed to delete account.")
     
@@ -1014,6 +1284,12 @@ def about_page():
         </div>
         """, unsafe_allow_html=True)
     
+    # Live batching statistics once the in-process scheduler is serving
+    serving_metrics = get_scheduler_metrics()
+    if serving_metrics is not None:
+        with st.expander("Serving metrics", expanded=False):
+            st.json(serving_metrics)
+    
     st.markdown('</div>', unsafe_allow_html=True)  # Close model card
     
     # Research papers
@@ -1187,6 +1463,7 @@ def main():
                 st.session_state.page = 'contact'
             elif selected == "Logout":
                 st.session_state.user = None
+                reset_history_pages()
                 st.session_state.page = 'login'
                 st.experimental_rerun()
     
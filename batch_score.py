@@ -0,0 +1,219 @@
+"""Headless batch scorer for directories of fundus images.
+
+Examples:
+    python batch_score.py uploads/ --output scores.csv
+    python batch_score.py --file-list images.txt --output scores.jsonl --save-to-db --user-id 1
+"""
+import argparse
+import io
+import csv
+import json
+import sys
+import numpy as np
+from PIL import Image
+
+from image_quality import check_image_quality
+from model_registry import registry as model_registry, MODEL_PATH, import_tensorflow
+from serving_config import load_serving_config
+from utils import (
+    image_to_model_input,
+    make_thumbnail_image,
+    get_enhanced_image,
+    compute_content_hash,
+    collect_image_paths,
+    StageTimer,
+    CLASS_NAMES,
+    IMAGE_SIZE,
+    PREVIEW_SIZE
+)
+
+# Applies the [threading] settings from serving.toml
+tf = import_tensorflow()
+
+
+def _load_image(path, check_quality=True, enhance=False, timer=None, enhance_cache_dir=None):
+    """Decode, quality-check and optionally enhance one image.
+
+    Returns (model input, error) instead of raising. The image is decoded
+    once at preview size, which serves the quality check, the enhancement and
+    the model input alike.
+    """
+    timer = timer or StageTimer()
+    path = path.decode()
+    try:
+        with timer.stage('decode'):
+            with open(path, 'rb') as f:
+                data = f.read()
+            with Image.open(io.BytesIO(data)) as img:
+                preview = make_thumbnail_image(img, PREVIEW_SIZE)
+                original_size = img.size
+    except Exception:
+        return np.zeros((IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32), b'could not decode image'
+
+    if check_quality:
+        with timer.stage('quality check'):
+            quality = check_image_quality(preview, original_size)
+        if not quality['passed']:
+            error = f"rejected by quality check: {'; '.join(quality['issues'])}"
+            return np.zeros((IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32), error.encode()
+
+    if enhance:
+        with timer.stage('enhancement'):
+            preview = get_enhanced_image(preview, compute_content_hash(data), enhance_cache_dir)
+    with timer.stage('preprocessing'):
+        return image_to_model_input(preview), b''
+
+def build_dataset(image_paths, batch_size, check_quality=True, enhance=False, timer=None, enhance_cache_dir=None):
+    """Build a tf.data pipeline with parallel decode/resize and batching."""
+    def load(path):
+        image, error = tf.numpy_function(
+            lambda path: _load_image(path, check_quality, enhance, timer, enhance_cache_dir),
+            [path], [tf.float32, tf.string]
+        )
+        image.set_shape((IMAGE_SIZE[1], IMAGE_SIZE[0], 3))
+        error.set_shape(())
+        return path, image, error
+
+    dataset = tf.data.Dataset.from_tensor_slices(image_paths)
+    dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+    dataset = dataset.batch(batch_size)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def score_images(image_paths, model, batch_size=32, check_quality=True, enhance=False, timer=None,
+                 enhance_cache_dir=None):
+    """Yield one result dict per image, in input order.
+
+    Stage timings are added to timer; loading stages run in parallel, so
+    their totals can exceed the wall time.
+    """
+    timer = timer or StageTimer()
+    for paths, images, errors in build_dataset(image_paths, batch_size, check_quality, enhance, timer, enhance_cache_dir):
+        errors = errors.numpy()
+        usable = np.flatnonzero(errors == b'')
+
+        # Only images that loaded and passed the quality check are scored
+        probabilities = np.zeros((len(errors), len(CLASS_NAMES)), dtype=np.float32)
+        if len(usable):
+            with timer.stage('inference'):
+                probabilities[usable] = model.predict(
+                    tf.gather(images, usable), batch_size=len(usable), verbose=0
+                )
+
+        for path, probs, error in zip(paths.numpy(), probabilities, errors):
+            path = path.decode()
+            if error:
+                yield {'image_path': path, 'error': error.decode()}
+                continue
+
+            class_index = int(np.argmax(probs))
+            yield {
+                'image_path': path,
+                'predicted_class': CLASS_NAMES[class_index],
+                'confidence': float(probs[class_index]),
+                'probabilities': {name: float(p) for name, p in zip(CLASS_NAMES, probs)},
+            }
+
+
+class ResultWriter:
+    """Stream results to a CSV or JSONL file depending on the extension."""
+
+    def __init__(self, output_path):
+        self.is_jsonl = output_path.lower().endswith(('.jsonl', '.json'))
+        self.file = open(output_path, 'w', newline='')
+        if not self.is_jsonl:
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(['image_path', 'predicted_class', 'confidence'] + CLASS_NAMES + ['error'])
+
+    def write(self, result):
+        if self.is_jsonl:
+            self.file.write(json.dumps(result) + '\n')
+            return
+
+        probabilities = result.get('probabilities', {})
+        self.writer.writerow(
+            [result['image_path'], result.get('predicted_class', ''), result.get('confidence', '')]
+            + [probabilities.get(name, '') for name in CLASS_NAMES]
+            + [result.get('error', '')]
+        )
+
+    def close(self):
+        self.file.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Score fundus images without the web UI.")
+    parser.add_argument('inputs', nargs='*', help="Image files or directories to score")
+    parser.add_argument('--file-list', help="Text file with one image path per line")
+    parser.add_argument('--output', '-o', required=True, help="Output file (.csv or .jsonl)")
+    parser.add_argument('--model', default=MODEL_PATH, help="Path to the model file (.h5, or a converted .tflite)")
+    parser.add_argument('--batch-size', type=int, default=32, help="Images per forward pass")
+    parser.add_argument('--enhance', action=argparse.BooleanOptionalAction,
+                        default=load_serving_config()['preprocessing']['enhance'],
+                        help="Score enhanced images (default: [preprocessing] enhance in serving.toml)")
+    parser.add_argument('--enhance-cache-dir',
+                        help="Keep enhanced images under this directory for later runs (default: not kept)")
+    parser.add_argument('--skip-quality-check', action='store_true', help="Score every image, even unusable ones")
+    parser.add_argument('--save-to-db', action='store_true', help="Also insert results into the predictions table")
+    parser.add_argument('--user-id', type=int, help="User ID to record predictions under (required with --save-to-db)")
+    args = parser.parse_args(argv)
+
+    if not args.inputs and not args.file_list:
+        parser.error("provide at least one input path or --file-list")
+    if args.save_to_db and args.user_id is None:
+        parser.error("--user-id is required with --save-to-db")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    image_paths = collect_image_paths(args.inputs, args.file_list)
+    if not image_paths:
+        print("No images found.", file=sys.stderr)
+        return 1
+
+    model = model_registry.get(args.model)
+
+    db = None
+    if args.save_to_db:
+        from db_module_1 import Database
+        db = Database()
+        model_version = model_registry.fingerprint(args.model)
+        if args.enhance:
+            model_version += "+enhanced"
+
+    writer = ResultWriter(args.output)
+    timer = StageTimer()
+    pending = []
+    scored = failed = 0
+    try:
+        results = score_images(
+            image_paths, model, args.batch_size,
+            check_quality=not args.skip_quality_check, enhance=args.enhance, timer=timer,
+            enhance_cache_dir=args.enhance_cache_dir
+        )
+        for result in results:
+            writer.write(result)
+            if 'error' in result:
+                failed += 1
+                continue
+
+            scored += 1
+            if db is not None:
+                probabilities = np.array([result['probabilities'][name] for name in CLASS_NAMES], dtype=np.float32)
+                pending.append((result['image_path'], result['predicted_class'], result['confidence'], probabilities.tobytes()))
+                if len(pending) >= args.batch_size:
+                    db.save_predictions(args.user_id, pending, model_version=model_version)
+                    pending = []
+
+        if db is not None and pending:
+            db.save_predictions(args.user_id, pending, model_version=model_version)
+    finally:
+        writer.close()
+
+    print(f"Scored {scored} images ({failed} failed) -> {args.output}")
+    print(f"Time per stage (summed over loader threads): {timer.summary()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
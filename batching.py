@@ -0,0 +1,154 @@
+import bisect
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+from model_registry import registry as model_registry, MODEL_PATH
+
+# Sentinel that tells a batching loop to stop
+STOP = None
+
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+
+def collect_batch(requests, max_batch_size, max_wait_ms):
+    """Block for one request, then gather more until the batch is full or the wait expires.
+
+    Returns (batch, stop) where stop means the STOP sentinel was received.
+    """
+    first = requests.get()
+    if first is STOP:
+        return [], True
+
+    batch = [first]
+    deadline = time.monotonic() + max_wait_ms / 1000
+    while len(batch) < max_batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = requests.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if item is STOP:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram; each bucket counts values <= its bound."""
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._total = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.bounds, value)] += 1
+            self._total += value
+            self._count += 1
+
+    def snapshot(self):
+        """Return counts per bucket label plus count and mean."""
+        with self._lock:
+            labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+            return {
+                'buckets': dict(zip(labels, self._counts)),
+                'count': self._count,
+                'mean': self._total / self._count if self._count else 0.0,
+            }
+
+
+class BatchScheduler:
+    """Coalesce concurrent single-image predictions into batched forward passes.
+
+    Requests wait at most max_wait_ms for company before the batch runs, and
+    never more than max_batch_size images share one pass. predict() mirrors
+    Keras ``model.predict`` so home_page can use the scheduler in place of
+    the model. Latency (submit to result) and batch-size histograms are
+    available from metrics().
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = collect_batch(self._requests, self.max_batch_size, self.max_wait_ms)
+            if not batch:
+                continue
+
+            self.batch_size.observe(len(batch))
+            try:
+                probabilities = self.predict_fn(np.stack([image for image, _, _ in batch]))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            for (_, future, submitted), probs in zip(batch, probabilities):
+                self.latency_ms.observe((finished - submitted) * 1000)
+                future.set_result(probs)
+
+    def submit(self, image):
+        """Queue one preprocessed (H, W, 3) image; the Future yields its probability vector."""
+        future = Future()
+        self._requests.put((np.asarray(image, dtype=np.float32), future, time.perf_counter()))
+        return future
+
+    def predict(self, images, batch_size=None, verbose=0):
+        """Score a (N, H, W, 3) array and return (N, num_classes) probabilities."""
+        futures = [self.submit(image) for image in images]
+        return np.stack([future.result() for future in futures])
+
+    def metrics(self):
+        """Return latency and batch-size histogram snapshots."""
+        return {
+            'latency_ms': self.latency_ms.snapshot(),
+            'batch_size': self.batch_size.snapshot(),
+        }
+
+    def shutdown(self):
+        """Stop the scheduling thread after queued requests are served."""
+        self._requests.put(STOP)
+        self._thread.join()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_batch_scheduler(model_path=MODEL_PATH, max_batch_size=32, max_wait_ms=5):
+    """Return the process-wide scheduler around the registry model."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            # Look the model up per batch so hot reloads are picked up
+            def predict_fn(images):
+                model = model_registry.get(model_path)
+                return model.predict(images, batch_size=len(images), verbose=0)
+
+            _scheduler = BatchScheduler(predict_fn, max_batch_size, max_wait_ms)
+        return _scheduler
+
+def get_scheduler_metrics():
+    """Return the running scheduler's metrics, or None if no scheduler has been started."""
+    with _scheduler_lock:
+        scheduler = _scheduler
+    return scheduler.metrics() if scheduler is not None else None
@@ -0,0 +1,100 @@
+"""Time building the History page chart for long prediction histories.
+
+Builds synthetic histories of each --scans length (newest first, as
+Database.get_user_predictions returns them) and times the original
+plot_prediction_history (sort, datetime.fromisoformat and a colour lookup
+per scan, every point plotted) against the vectorized, downsampled version
+in utils and a hit in the per-user figure cache. The serialized figure size
+is what the browser has to receive and draw.
+
+    python benchmarks/bench_chart.py
+    python benchmarks/bench_chart.py --scans 100 10000 1000000 --repeats 5
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from figure_cache import FigureCache
+from utils import CLASS_NAMES, get_class_color, plot_prediction_history
+
+
+def original_plot_prediction_history(predictions, class_names):
+    """The chart code History used to run on every render."""
+    sorted_preds = sorted(predictions, key=lambda x: x['timestamp'])
+    dates = [datetime.fromisoformat(pred['timestamp']) for pred in sorted_preds]
+    classes = [pred['predicted_class'] for pred in sorted_preds]
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    severity_levels = {class_name: i for i, class_name in enumerate(class_names)}
+    fig.add_trace(
+        go.Scatter(
+            x=dates,
+            y=[severity_levels[cls] for cls in classes],
+            mode='lines+markers',
+            name='Severity Level',
+            line=dict(color='#3498db', width=3),
+            marker=dict(
+                size=10,
+                color=[get_class_color(cls) for cls in classes],
+                line=dict(color='white', width=2)
+            )
+        )
+    )
+    fig.update_layout(
+        title="Retinopathy Progression Over Time",
+        xaxis=dict(title="Date", tickformat="%b %d, %Y"),
+        yaxis=dict(title="Severity Level", tickvals=list(range(len(class_names))), ticktext=class_names),
+        plot_bgcolor='rgba(0,0,0,0)',
+        height=400,
+    )
+    return fig
+
+def make_history(scans):
+    """Synthetic predictions, newest first, one every few hours."""
+    rng = np.random.default_rng(0)
+    start = datetime(2015, 1, 1)
+    classes = rng.integers(0, len(CLASS_NAMES), scans)
+    return [
+        {'id': i, 'timestamp': (start + timedelta(hours=3 * i)).isoformat(), 'predicted_class': CLASS_NAMES[c]}
+        for i, c in enumerate(classes)
+    ][::-1]
+
+def time_build(build, repeats):
+    """Return (median milliseconds per call, last figure)."""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fig = build()
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)[len(timings) // 2], fig
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scans', type=int, nargs='+', default=[100, 10000, 200000])
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'scans':>8} {'variant':<10} {'ms':>10} {'points':>8} {'json KB':>9}")
+    for scans in args.scans:
+        predictions = make_history(scans)
+        cache = FigureCache()
+        variants = {
+            'original': lambda: original_plot_prediction_history(predictions, CLASS_NAMES),
+            'vectorized': lambda: plot_prediction_history(predictions, CLASS_NAMES),
+            'cached': lambda: cache.get(1, scans, lambda: plot_prediction_history(predictions, CLASS_NAMES)),
+        }
+        for name, build in variants.items():
+            ms, fig = time_build(build, args.repeats)
+            print(f"{scans:>8} {name:<10} {ms:>10.3f} {len(fig.data[0].x):>8} {len(fig.to_json()) / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
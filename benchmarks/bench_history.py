@@ -0,0 +1,125 @@
+"""Benchmark History page queries as the predictions table grows.
+
+Builds a throwaway database with --users users and grows it through each
+--rows size. At every size it times, with and without the
+(user_id, timestamp DESC, id DESC) index, the queries History runs: the
+first page (limit=HISTORY_PAGE_SIZE + 1) and a later keyset page (after=
+a row halfway through the user's history), next to the full unpaged
+get_user_predictions. With the index, page latency should hold flat as
+the table grows.
+
+    python benchmarks/bench_history.py
+    python benchmarks/bench_history.py --rows 10000 100000 1000000 --users 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_module_1 import Database
+
+CLASS_NAMES = ['Mild', 'Moderate', 'Severe', 'Proliferative DR']
+HISTORY_PAGE_SIZE = 10  # Matches app.py
+INDEX_NAME = 'idx_predictions_user_timestamp_id'
+INDEX_SQL = f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON predictions (user_id, timestamp DESC, id DESC)"
+
+
+def populate(db, first_row, rows, users, chunk_size=50000):
+    """Insert synthetic predictions first_row..rows-1 in large transactions."""
+    rng = random.Random(first_row)
+    start = datetime(2020, 1, 1)
+    inserted = first_row
+    while inserted < rows:
+        count = min(chunk_size, rows - inserted)
+        batch = [
+            (
+                rng.randint(1, users),
+                f"uploads/{inserted + i:08d}.jpg",
+                rng.choice(CLASS_NAMES),
+                rng.random(),
+                (start + timedelta(minutes=inserted + i)).isoformat(),
+            )
+            for i in range(count)
+        ]
+        with db._transaction() as cursor:
+            cursor.executemany(
+                "INSERT INTO predictions (user_id, image_path, predicted_class, confidence, timestamp) VALUES (?, ?, ?, ?, ?)",
+                batch
+            )
+        inserted += count
+
+def sample_cursors(db, users, samples):
+    """Pick users and, for each, the (timestamp, id) cursor halfway through their history."""
+    rng = random.Random(1)
+    cursors = []
+    for _ in range(samples):
+        user_id = rng.randint(1, users)
+        count = db._fetchone("SELECT COUNT(*) FROM predictions WHERE user_id = ?", (user_id,))[0]
+        row = db._fetchone(
+            "SELECT timestamp, id FROM predictions WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?",
+            (user_id, count // 2)
+        )
+        cursors.append((user_id, (row['timestamp'], row['id']) if row else None))
+    return cursors
+
+def time_query(query, cursors):
+    """Return the median and p95 latency (ms) of query(user_id, cursor)."""
+    timings = []
+    for user_id, cursor in cursors:
+        started = time.perf_counter()
+        query(user_id, cursor)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+
+def query_plan(db):
+    rows = db._fetchall(
+        "EXPLAIN QUERY PLAN SELECT * FROM predictions WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+        (1, HISTORY_PAGE_SIZE + 1)
+    )
+    return "; ".join(row['detail'] for row in rows)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--samples', type=int, default=50)
+    args = parser.parse_args()
+
+    queries = {
+        'first page': lambda db: lambda user_id, cursor: db.get_user_predictions(
+            user_id, limit=HISTORY_PAGE_SIZE + 1),
+        'later page': lambda db: lambda user_id, cursor: db.get_user_predictions(
+            user_id, after=cursor, limit=HISTORY_PAGE_SIZE + 1),
+        'full history': lambda db: lambda user_id, cursor: db.get_user_predictions(user_id),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+
+        print(f"{args.users} users, page size {HISTORY_PAGE_SIZE}, median / p95 ms over {args.samples} users\n")
+        print(f"{'rows':>9} {'index':<6}" + "".join(f" {name:>17}" for name in queries))
+        populated = 0
+        for rows in sorted(args.rows):
+            populate(db, populated, rows, args.users)
+            populated = rows
+            cursors = sample_cursors(db, args.users, args.samples)
+
+            for indexed in (False, True):
+                with db._transaction() as cursor:
+                    cursor.execute(INDEX_SQL if indexed else f"DROP INDEX IF EXISTS {INDEX_NAME}")
+                    cursor.execute("ANALYZE")
+                timings = [time_query(query(db), cursors) for query in queries.values()]
+                print(f"{rows:>9} {'yes' if indexed else 'no':<6}"
+                      + "".join(f" {median:>8.2f} / {p95:>6.2f}" for median, p95 in timings))
+
+        print(f"\nPlan with index: {query_plan(db)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Measure how long a fresh process takes before the login page can render.
+
+Each scenario runs in a new interpreter and times importing the modules
+app.py needs for the login page, with TensorFlow deferred (current
+behaviour) and with TensorFlow imported eagerly up front (previous
+behaviour).
+
+    python benchmarks/bench_import.py --runs 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOGIN_PAGE_IMPORTS = """
+import streamlit
+import utils
+import db_module_1
+import model_registry
+import prediction_cache
+db_module_1.Database('bench.db')
+"""
+
+SCENARIOS = {
+    'lazy (current)': LOGIN_PAGE_IMPORTS,
+    'eager TensorFlow': "import tensorflow\n" + LOGIN_PAGE_IMPORTS,
+    'TensorFlow alone': "import tensorflow\n",
+}
+
+TIMER = """
+import os, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+{body}
+print(time.perf_counter() - started)
+sys.stdout.flush()
+os._exit(0)
+"""
+
+
+def time_scenario(body, runs):
+    """Return sorted wall times (seconds) of body across fresh interpreters."""
+    code = TIMER.format(root=REPO_ROOT, body=body)
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL='3')
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, '-c', code], cwd=tmp, env=env,
+                check=True, capture_output=True, text=True
+            ).stdout
+            timings.append(float(output.strip().splitlines()[-1]))
+    return sorted(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<18} {'median s':>9} {'min s':>7}")
+    for name, body in SCENARIOS.items():
+        timings = time_scenario(body, args.runs)
+        print(f"{name:<18} {timings[len(timings) // 2]:>9.2f} {timings[0]:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
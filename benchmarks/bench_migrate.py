@@ -0,0 +1,124 @@
+"""Time an in-place upgrade of a large legacy database and the stalls it causes.
+
+Builds a throwaway database in the old db_module layout (prediction_class /
+created_at) with --rows predictions, then runs the migrations while another
+connection keeps writing, as a live application would. Reports, for each
+migration step and --batch-sizes value, how long the step took and the
+longest time a single concurrent write had to wait for it.
+
+    python benchmarks/bench_migrate.py --rows 2000000
+    python benchmarks/bench_migrate.py --rows 2000000 --batch-sizes 10000 50000 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import migrate
+
+CLASS_NAMES = ['Mild', 'Moderate', 'Severe', 'Proliferative DR']
+
+
+def build_legacy_db(db_path, rows, users, chunk_size=100000):
+    """Create a database the way db_module used to, filled with synthetic predictions."""
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            full_name TEXT,
+            created_at TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            image_path TEXT,
+            prediction_class TEXT,
+            confidence REAL,
+            created_at TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    conn.execute("CREATE INDEX idx_predictions_user_created ON predictions (user_id, created_at DESC)")
+
+    rng = random.Random(0)
+    start = datetime(2020, 1, 1)
+    for inserted in range(0, rows, chunk_size):
+        conn.executemany(
+            "INSERT INTO predictions (user_id, image_path, prediction_class, confidence, created_at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (rng.randint(1, users), f"uploads/{i:08d}.jpg", rng.choice(CLASS_NAMES), rng.random(),
+                 (start + timedelta(minutes=i)).isoformat())
+                for i in range(inserted, min(inserted + chunk_size, rows))
+            ]
+        )
+        conn.commit()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+
+def write_continuously(db_path, stop, stalls):
+    """Commit a tiny write every few milliseconds and record how long each one took."""
+    conn = sqlite3.connect(db_path, timeout=600)
+    conn.execute("CREATE TABLE IF NOT EXISTS heartbeat (at REAL)")
+    conn.commit()
+    while not stop.is_set():
+        started = time.perf_counter()
+        conn.execute("INSERT INTO heartbeat (at) VALUES (?)", (started,))
+        conn.commit()
+        stalls.append((started, time.perf_counter() - started))
+        time.sleep(0.005)
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[50000, 10 ** 9])
+    args = parser.parse_args()
+
+    print(f"{args.rows} legacy predictions over {args.users} users\n")
+    print(f"{'batch size':>12} {'step':<26} {'seconds':>8} {'max write wait ms':>18}")
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, 'legacy.db')
+        build_legacy_db(template, args.rows, args.users)
+
+        for batch_size in args.batch_sizes:
+            db_path = os.path.join(tmp, f'upgrade_{batch_size}.db')
+            with open(template, 'rb') as src, open(db_path, 'wb') as dst:
+                dst.write(src.read())
+
+            stop = threading.Event()
+            stalls = []
+            writer = threading.Thread(target=write_continuously, args=(db_path, stop, stalls))
+            writer.start()
+            time.sleep(0.2)
+
+            conn = sqlite3.connect(db_path, timeout=600)
+            conn.execute("PRAGMA journal_mode=WAL")
+            steps = [(None, time.perf_counter())]
+            migrate(conn, batch_size, progress=lambda version, migration: steps.append((migration, time.perf_counter())))
+            conn.close()
+
+            stop.set()
+            writer.join()
+            os.remove(db_path)
+
+            # A write is charged to the step that was running when it started
+            for (_, begin), (migration, end) in zip(steps, steps[1:]):
+                waits = [wait for at, wait in stalls if begin <= at < end] or [0]
+                print(f"{batch_size:>12} {migration.__name__:<26} {end - begin:>8.2f} {max(waits) * 1000:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Per-call prediction latency: Keras model.predict vs the compiled serving path.
+
+Times model.predict (the previous serving path), the CompiledModel the
+registry now serves (a tf.function traced once with a fixed input
+signature), and the same function XLA-compiled, at each batch size. Every
+variant is warmed up at each batch size before timing.
+
+    python benchmarks/bench_predict.py
+    python benchmarks/bench_predict.py --model model/model.h5 --batch-sizes 1 8 32 --repeats 200
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from model_registry import CompiledModel, MODEL_PATH, registry
+
+
+def time_calls(predict, images, repeats):
+    """Return sorted per-call latencies in milliseconds."""
+    predict(images)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        predict(images)
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=MODEL_PATH, help="Keras model file")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--repeats', type=int, default=100)
+    args = parser.parse_args()
+
+    keras_model = registry.get(args.model).model
+    variants = {
+        'model.predict': lambda images: keras_model.predict(images, verbose=0),
+        'tf.function': CompiledModel(keras_model).predict,
+        'tf.function+XLA': CompiledModel(keras_model, jit_compile=True).predict,
+    }
+
+    rng = np.random.default_rng(0)
+    print(f"{'variant':<16} {'batch':>6} {'median ms':>10} {'p95 ms':>8} {'speedup':>8}")
+    for batch_size in args.batch_sizes:
+        images = rng.random((batch_size,) + tuple(keras_model.input_shape[1:]), dtype=np.float32)
+        baseline = None
+        for name, predict in variants.items():
+            timings = time_calls(predict, images, args.repeats)
+            median = timings[len(timings) // 2]
+            baseline = baseline or median
+            print(f"{name:<16} {batch_size:>6} {median:>10.2f} "
+                  f"{timings[int(len(timings) * 0.95)]:>8.2f} {baseline / median:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
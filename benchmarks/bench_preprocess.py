@@ -0,0 +1,128 @@
+"""Benchmark utils.preprocess_image against the original full-decode version.
+
+Peak memory is measured: each variant preprocesses every image once in a
+fresh process, which resets its peak RSS after the imports (Linux
+/proc/self/clear_refs) and reports how far VmHWM rises above that. The absolute difference from the original's output is reported per image.
+By default a synthetic 3000x2000 JPEG is generated; pass --images to use
+real files instead.
+
+    python benchmarks/bench_preprocess.py
+    python benchmarks/bench_preprocess.py --images uploads/*.jpg
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+import utils
+
+VARIANTS = ('original', 'draft')
+
+
+def original_preprocess_image(image_path):
+    """The full-resolution decode path preprocess_image used to take."""
+    img = Image.open(image_path)
+    img = img.resize(utils.IMAGE_SIZE)
+    img_array = np.array(img)
+    if len(img_array.shape) == 2:
+        img_array = np.stack((img_array,) * 3, axis=-1)
+    if img_array.shape[2] == 4:
+        img_array = img_array[:, :, :3]
+    img_array = img_array.astype(np.float32) / 255.0
+    return np.expand_dims(img_array, axis=0)
+
+def make_synthetic_jpeg(directory, size=(3000, 2000)):
+    """Write a fundus-like test JPEG (bright disc on black) and return its path."""
+    width, height = size
+    y, x = np.ogrid[:height, :width]
+    radius = min(width, height) * 0.45
+    disc = ((x - width / 2) ** 2 + (y - height / 2) ** 2) <= radius ** 2
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 255, (height, width, 3), dtype=np.uint8) // 4
+    pixels[disc] += np.array([150, 60, 20], dtype=np.uint8)
+    path = os.path.join(directory, 'synthetic.jpg')
+    Image.fromarray(pixels).save(path, quality=90)
+    return path
+
+def get_preprocess(variant):
+    return original_preprocess_image if variant == 'original' else utils.preprocess_image
+
+def read_peak_rss_kb():
+    """Return this process's peak resident set size (VmHWM) in KiB."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+
+def measure_peak_megabytes(variant, images):
+    """Peak RSS growth, in MB, of a fresh process running variant once over images."""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--measure', variant, '--images', *images],
+        capture_output=True, text=True, check=True
+    )
+    return float(result.stdout)
+
+def run_variant(variant, images, repeats):
+    """Time one variant and return its stats as a dict."""
+    preprocess = get_preprocess(variant)
+
+    timings = []
+    for _ in range(repeats):
+        for image_path in images:
+            started = time.perf_counter()
+            preprocess(image_path)
+            timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    return {
+        'median_ms': timings[len(timings) // 2],
+        'p95_ms': timings[int(len(timings) * 0.95)],
+        'peak_mb': measure_peak_megabytes(variant, images),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', nargs='*', help="Image files to preprocess")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--measure', choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # Child process for measure_peak_megabytes. Importing utils peaks
+        # above the resident size it settles at, so start from a fresh peak
+        preprocess = get_preprocess(args.measure)
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        baseline = read_peak_rss_kb()
+        for image_path in args.images:
+            preprocess(image_path)
+        print((read_peak_rss_kb() - baseline) / 1024)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        images = args.images or [make_synthetic_jpeg(tmp)]
+
+        print(f"{len(images)} image(s), {args.repeats} repeats\n")
+        print(f"{'image':<48} {'mode':<5} {'size':>11} {'max diff':>9} {'mean diff':>10}")
+        for path in images:
+            with Image.open(path) as img:
+                mode, size = img.mode, f"{img.width}x{img.height}"
+            difference = np.abs(original_preprocess_image(path) - utils.preprocess_image(path))
+            print(f"{os.path.basename(path)[:48]:<48} {mode:<5} {size:>11} {difference.max():>9.4f} {difference.mean():>10.4f}")
+        print()
+
+        print(f"{'variant':<10} {'median ms':>10} {'p95 ms':>10} {'peak RSS MB':>12}")
+        for variant in VARIANTS:
+            stats = run_variant(variant, images, args.repeats)
+            print(f"{variant:<10} {stats['median_ms']:>10.2f} {stats['p95_ms']:>10.2f} {stats['peak_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
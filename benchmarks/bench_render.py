@@ -0,0 +1,89 @@
+"""Per-interaction overhead of the page assets every render loads.
+
+Streamlit re-runs the page script on every click, so whatever load_css()
+and load_remedies_data() do is paid per interaction. This times the
+original paths (open and read styles.css and build the <style> markup;
+open and parse remedies.json) against the mtime-checked in-memory cache
+app.py now uses. st.markdown is left out: both paths emit the same markup.
+
+    python benchmarks/bench_render.py
+    python benchmarks/bench_render.py --renders 20000
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from file_cache import FileCache
+
+
+def original_load_css(css_file):
+    """The file I/O load_css used to do on every render."""
+    if not os.path.exists(css_file):
+        raise FileNotFoundError(css_file)
+    with open(css_file, "r") as f:
+        return f"<style>{f.read()}</style>"
+
+def cached_load_css(cache, css_file):
+    """The file I/O load_css does now."""
+    if not os.path.exists(css_file):
+        raise FileNotFoundError(css_file)
+    return cache.get(css_file, lambda text: f"<style>{text}</style>")
+
+def original_load_remedies(remedies_path):
+    """The file I/O load_remedies_data used to do on every render."""
+    if not os.path.exists(remedies_path):
+        raise FileNotFoundError(remedies_path)
+    with open(remedies_path, 'r') as file:
+        return json.load(file)
+
+def cached_load_remedies(cache, remedies_path):
+    """The file I/O load_remedies_data does now."""
+    if not os.path.exists(remedies_path):
+        raise FileNotFoundError(remedies_path)
+    return cache.get(remedies_path, json.loads)
+
+def time_renders(render, renders):
+    """Return mean microseconds per call of render()."""
+    render()
+    started = time.perf_counter()
+    for _ in range(renders):
+        render()
+    return (time.perf_counter() - started) / renders * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--renders', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        css_file = shutil.copy(os.path.join(REPO_ROOT, 'styles.css'), tmp)
+        remedies_path = shutil.copy(os.path.join(REPO_ROOT, 'remedies.json'), tmp)
+        cache = FileCache()
+
+        # One page render: the stylesheet plus the remedies (Home and History)
+        variants = {
+            'original': lambda: (original_load_css(css_file), original_load_remedies(remedies_path)),
+            'cached': lambda: (cached_load_css(cache, css_file), cached_load_remedies(cache, remedies_path)),
+        }
+        assert variants['original']() == variants['cached']()
+
+        print(f"{args.renders} renders, styles.css {os.path.getsize(css_file)} bytes, "
+              f"remedies.json {os.path.getsize(remedies_path)} bytes\n")
+        print(f"{'variant':<10} {'us/render':>10}")
+        for name, render in variants.items():
+            print(f"{name:<10} {time_renders(render, args.renders):>10.1f}")
+
+        # Editing a file must be picked up on the next render
+        with open(remedies_path, 'w') as f:
+            json.dump({'Mild': 'edited'}, f)
+        assert cached_load_remedies(cache, remedies_path) == {'Mild': 'edited'}
+
+if __name__ == "__main__":
+    main()
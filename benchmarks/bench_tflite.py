@@ -0,0 +1,144 @@
+"""Compare the Keras model against its quantized TFLite conversions.
+
+For each backend this reports model file size, peak RSS of a fresh process
+that loads the model and scores the images, latency at batch size 1 and
+--batch-size, and agreement with the float Keras model (top-1 match rate and
+largest probability difference). Pass --labels (a CSV of image_path,label
+with label a class name or index) to also report accuracy against ground
+truth. Without --images, synthetic fundus-like JPEGs are generated; int8
+calibration uses the same images unless --calibration-dir is given.
+
+    python benchmarks/bench_tflite.py
+    python benchmarks/bench_tflite.py --images uploads --labels labels.csv
+"""
+import argparse
+import csv
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from model_registry import MODEL_PATH
+from utils import collect_image_paths, preprocess_images, CLASS_NAMES
+
+BACKENDS = ('keras', 'dynamic', 'int8')
+
+
+def make_synthetic_images(directory, count=64, size=(600, 400)):
+    """Write count fundus-like JPEGs (bright disc on noise) and return the directory."""
+    width, height = size
+    y, x = np.ogrid[:height, :width]
+    disc = ((x - width / 2) ** 2 + (y - height / 2) ** 2) <= (min(width, height) * 0.45) ** 2
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        pixels = rng.integers(0, 255, (height, width, 3), dtype=np.uint8) // 4
+        pixels[disc] += rng.integers(20, 150, 3).astype(np.uint8)
+        Image.fromarray(pixels).save(os.path.join(directory, f"synthetic_{i:03d}.jpg"), quality=90)
+    return directory
+
+def load_labels(labels_path):
+    """Read image_path,label rows into {absolute path: class index}."""
+    labels = {}
+    with open(labels_path, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0] == 'image_path':
+                continue
+            label = row[1].strip()
+            labels[os.path.abspath(row[0])] = CLASS_NAMES.index(label) if label in CLASS_NAMES else int(label)
+    return labels
+
+def run_backend(model_path, images, batch_size, repeats):
+    """Score images with one model file in this (fresh) process and report stats."""
+    from model_registry import registry
+    from tflite_backend import TFLiteModel
+
+    model = TFLiteModel(model_path) if model_path.endswith('.tflite') else registry.get(model_path)
+
+    timings = {1: [], batch_size: []}
+    for size in timings:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            model.predict(images[:size], batch_size=size, verbose=0)
+            timings[size].append((time.perf_counter() - started) * 1000)
+
+    probabilities = np.concatenate([
+        model.predict(images[start:start + batch_size], batch_size=batch_size, verbose=0)
+        for start in range(0, len(images), batch_size)
+    ])
+    return {
+        'probabilities': probabilities,
+        'latency_ms': {size: sorted(values)[len(values) // 2] for size, values in timings.items()},
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def measure(model_path, images, batch_size, repeats):
+    """Run run_backend in a spawned process so memory is measured per backend."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn')) as executor:
+        return executor.submit(run_backend, model_path, images, batch_size, repeats).result()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=MODEL_PATH, help="Keras model to convert")
+    parser.add_argument('--images', nargs='*', help="Image files or directories to score")
+    parser.add_argument('--labels', help="CSV of image_path,label for accuracy")
+    parser.add_argument('--calibration-dir', help="Images for int8 calibration (default: the scored images)")
+    parser.add_argument('--calibration-samples', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    from model_registry import registry
+    from tflite_backend import convert_to_tflite
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = args.images or [make_synthetic_images(tmp)]
+        image_paths = collect_image_paths(inputs)
+        images = preprocess_images(image_paths)
+        calibration_dir = args.calibration_dir or (inputs[0] if os.path.isdir(inputs[0]) else os.path.dirname(inputs[0]))
+
+        # Make sure the Keras model exists before converting it
+        registry.get(args.model)
+        model_paths = {'keras': args.model}
+        for quantization in BACKENDS[1:]:
+            model_paths[quantization] = convert_to_tflite(
+                args.model, quantization, calibration_dir, args.calibration_samples,
+                output_path=os.path.join(tmp, f"model_{quantization}.tflite")
+            )
+
+        labels = load_labels(args.labels) if args.labels else None
+        if labels:
+            labelled = [i for i, path in enumerate(image_paths) if os.path.abspath(path) in labels]
+            truth = np.array([labels[os.path.abspath(image_paths[i])] for i in labelled])
+
+        print(f"{len(image_paths)} image(s), {args.repeats} repeats\n")
+        header = (f"{'backend':<8} {'size MB':>8} {'peak RSS MB':>12} {'b=1 ms':>8} "
+                  f"{f'b={args.batch_size} ms':>9} {'top-1 agree':>12} {'max |dp|':>9}")
+        print(header + (f" {'accuracy':>9}" if labels else ''))
+
+        reference = None
+        for backend in BACKENDS:
+            stats = measure(model_paths[backend], images, args.batch_size, args.repeats)
+            probabilities = stats['probabilities']
+            if reference is None:
+                reference = probabilities
+
+            agreement = np.mean(probabilities.argmax(axis=1) == reference.argmax(axis=1))
+            max_diff = np.abs(probabilities - reference).max()
+            line = (f"{backend:<8} {os.path.getsize(model_paths[backend]) / (1024 * 1024):>8.2f} "
+                    f"{stats['peak_rss_mb']:>12.0f} {stats['latency_ms'][1]:>8.2f} "
+                    f"{stats['latency_ms'][args.batch_size]:>9.2f} {agreement:>12.1%} {max_diff:>9.4f}")
+            if labels:
+                line += f" {np.mean(probabilities[labelled].argmax(axis=1) == truth):>9.1%}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
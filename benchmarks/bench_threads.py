@@ -0,0 +1,112 @@
+"""Find the best workers x threads layout for the cores on this host.
+
+Each layout starts `workers` processes that configure TensorFlow with
+`threads` intra-op threads (0 = TensorFlow's default of one per core, the
+oversubscribed baseline), optionally pin themselves to their own slice of
+CPUs, and then predict in a loop for --seconds. Aggregate throughput and
+per-call latency show which [threading] / [inference] workers settings to
+put in serving.toml.
+
+    python benchmarks/bench_threads.py
+    python benchmarks/bench_threads.py --cores 16 --batch-size 8 --pin
+"""
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from inference_worker import worker_cpus
+from model_registry import MODEL_PATH
+
+
+def run_worker(model_path, threads, onednn, cpus, batch_size, seconds, barrier, results):
+    """Configure threading, load the model, then predict until the time is up."""
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+    from model_registry import import_tensorflow, registry
+
+    import_tensorflow({'intra_op_threads': threads, 'inter_op_threads': 1 if threads else 0, 'onednn': onednn})
+    model = registry.get(model_path)
+    images = np.random.default_rng(0).random((batch_size,) + tuple(model.model.input_shape[1:]), dtype=np.float32)
+
+    barrier.wait()
+    timings = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        model.predict(images)
+        timings.append((time.perf_counter() - started) * 1000)
+    results.put(timings)
+
+def run_layout(workers, threads, args, cpus):
+    """Return (images per second, p50 ms, p95 ms) for one layout."""
+    context = mp.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=run_worker,
+            args=(args.model, threads, not args.no_onednn,
+                  worker_cpus(index, workers, cpus) if args.pin else None,
+                  args.batch_size, args.seconds, barrier, results),
+            daemon=True
+        )
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    timings = []
+    try:
+        for _ in processes:
+            timings.extend(results.get(timeout=args.seconds + 300))
+    except queue.Empty:
+        raise RuntimeError(f"Layout {workers}x{threads} did not finish") from None
+    finally:
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+
+    timings.sort()
+    throughput = len(timings) * args.batch_size / args.seconds
+    return throughput, timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+
+def layouts(cores):
+    """Oversubscribed defaults plus every workers x threads split that fills the cores."""
+    splits = [(workers, cores // workers) for workers in range(1, cores + 1) if cores % workers == 0]
+    return [(workers, 0) for workers in sorted({1, 2, min(4, cores)})] + splits
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=MODEL_PATH, help="Keras model file")
+    parser.add_argument('--cores', type=int, help="Cores to plan for (default: all available)")
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--pin', action='store_true', help="Pin each worker to its own CPUs")
+    parser.add_argument('--no-onednn', action='store_true', help="Disable oneDNN kernels")
+    args = parser.parse_args()
+
+    from model_registry import registry
+
+    # Create the placeholder model once, up front, if there is none yet
+    registry.get(args.model)
+
+    cpus = sorted(os.sched_getaffinity(0))[:args.cores] if args.cores else sorted(os.sched_getaffinity(0))
+    print(f"{len(cpus)} core(s), batch size {args.batch_size}, {args.seconds:g}s per layout"
+          f"{', pinned' if args.pin else ''}\n")
+    print(f"{'workers':>7} {'threads':>8} {'images/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for workers, threads in layouts(len(cpus)):
+        throughput, p50, p95 = run_layout(workers, threads, args, cpus)
+        print(f"{workers:>7} {threads or 'default':>8} {throughput:>9.1f} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,186 +1,101 @@
+"""Legacy interface to the application database.
+
+Database here is db_module_1.Database with this module's old default path
+(diabetic_retinopathy.db) and its old method contracts: create_user and
+save_prediction return the new row, get_user_by_id exists, update_user_profile
+takes optional fields, and prediction rows also carry the old
+prediction_class / created_at keys. Timestamps are written in UTC like the
+rows already in the file, and no default admin user is created. The file
+itself is upgraded in place to the unified schema by migrations.py when it is
+opened; its users and predictions stay in it and are not merged into
+data/dr_detection.db.
+"""
 import sqlite3
-import os
-import hashlib
-from datetime import datetime
-
-class Database:
-    def __init__(self, db_path="diabetic_retinopathy.db"):
-        self.db_path = db_path
-        self._create_tables()
-    
-    def _get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
-    
-    def _create_tables(self):
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        # Create users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                full_name TEXT,
-                created_at TEXT
-            )
-        ''')
-        
-        # Create predictions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS predictions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                image_path TEXT,
-                prediction_class TEXT,
-                confidence REAL,
-                created_at TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
+from datetime import datetime, timezone
+
+import db_module_1
+
+LEGACY_DB_PATH = "diabetic_retinopathy.db"
+
+
+def _utc_now():
+    # Same naive ISO format the old module wrote with datetime.utcnow()
+    return datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class Database(db_module_1.Database):
+    def __init__(self, db_path=LEGACY_DB_PATH):
+        super().__init__(db_path)
+
+    def _create_default_user(self):
+        pass
+
     def create_user(self, username, email, password, full_name=None):
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # Using SHA-256 for password hashing instead of bcrypt
-            password_hash = hashlib.sha256(password.encode()).hexdigest()
-            created_at = datetime.utcnow().isoformat()
-            
-            cursor.execute(
-                "INSERT INTO users (username, email, password_hash, full_name, created_at) VALUES (?, ?, ?, ?, ?)",
-                (username, email, password_hash, full_name, created_at)
-            )
-            
-            conn.commit()
-            
-            # Get the created user
-            cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-            user_data = cursor.fetchone()
-            
-            return dict(user_data) if user_data else None
-            
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "INSERT INTO users (username, email, password_hash, full_name, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (username, email, self._hash_password(password), full_name, _utc_now())
+                )
+                user_id = cursor.lastrowid
         except sqlite3.IntegrityError as e:
-            conn.rollback()
-            if "UNIQUE constraint failed: users.username" in str(e):
+            if "users.username" in str(e):
                 raise Exception("Username already exists")
-            elif "UNIQUE constraint failed: users.email" in str(e):
+            elif "users.email" in str(e):
                 raise Exception("Email already exists")
-            else:
-                raise e
-        finally:
-            conn.close()
-    
-    def authenticate_user(self, username, password):
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        
-        cursor.execute(
-            "SELECT * FROM users WHERE username = ? AND password_hash = ?",
-            (username, password_hash)
-        )
-        
-        user_data = cursor.fetchone()
-        conn.close()
-        
-        return dict(user_data) if user_data else None
-    
+            raise
+
+        return self.get_user_by_id(user_id)
+
     def save_prediction(self, user_id, image_path, prediction_class, confidence):
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            created_at = datetime.utcnow().isoformat()
-            
+        timestamp = _utc_now()
+
+        with self._transaction() as cursor:
             cursor.execute(
-                "INSERT INTO predictions (user_id, image_path, prediction_class, confidence, created_at) VALUES (?, ?, ?, ?, ?)",
-                (user_id, image_path, prediction_class, confidence, created_at)
+                "INSERT INTO predictions (user_id, image_path, predicted_class, confidence, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (user_id, image_path, prediction_class, confidence, timestamp)
             )
-            
-            conn.commit()
-            
-            # Get the created prediction
             prediction_id = cursor.lastrowid
-            cursor.execute("SELECT * FROM predictions WHERE id = ?", (prediction_id,))
-            prediction_data = cursor.fetchone()
-            
-            return dict(prediction_data) if prediction_data else None
-            
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
-    
-    def get_user_predictions(self, user_id):
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "SELECT * FROM predictions WHERE user_id = ? ORDER BY created_at DESC",
-            (user_id,)
-        )
-        
-        predictions = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return predictions
-    
+
+        prediction = self._fetchone("SELECT * FROM predictions WHERE id = ?", (prediction_id,))
+        return self._with_legacy_keys(dict(prediction)) if prediction else None
+
+    def get_user_predictions(self, user_id, after=None, limit=None):
+        return [
+            self._with_legacy_keys(prediction)
+            for prediction in super().get_user_predictions(user_id, after=after, limit=limit)
+        ]
+
     def get_user_by_id(self, user_id):
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-        
-        user_data = cursor.fetchone()
-        conn.close()
-        
-        return dict(user_data) if user_data else None
-    
+        user = self._fetchone("SELECT * FROM users WHERE id = ?", (user_id,))
+        return dict(user) if user else None
+
     def update_user_profile(self, user_id, full_name=None, email=None):
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            updates = []
-            params = []
-            
-            if full_name is not None:
-                updates.append("full_name = ?")
-                params.append(full_name)
-            
-            if email is not None:
-                updates.append("email = ?")
-                params.append(email)
-            
-            if not updates:
-                return self.get_user_by_id(user_id)
-            
+        updates = []
+        params = []
+
+        if full_name is not None:
+            updates.append("full_name = ?")
+            params.append(full_name)
+
+        if email is not None:
+            updates.append("email = ?")
+            params.append(email)
+
+        if updates:
             params.append(user_id)
-            
-            cursor.execute(
-                f"UPDATE users SET {', '.join(updates)} WHERE id = ?",
-                tuple(params)
-            )
-            
-            conn.commit()
-            
-            return self.get_user_by_id(user_id)
-            
-        except sqlite3.IntegrityError as e:
-            conn.rollback()
-            if "UNIQUE constraint failed: users.email" in str(e):
-                raise Exception("Email already exists")
-            else:
-                raise e
-        finally:
-            conn.close()
\ No newline at end of file
+            try:
+                with self._transaction() as cursor:
+                    cursor.execute(f"UPDATE users SET {', '.join(updates)} WHERE id = ?", tuple(params))
+            except sqlite3.IntegrityError as e:
+                if "users.email" in str(e):
+                    raise Exception("Email already exists")
+                raise
+
+        return self.get_user_by_id(user_id)
+
+    def _with_legacy_keys(self, prediction):
+        # Rows used to be read as prediction_class / created_at
+        prediction['prediction_class'] = prediction['predicted_class']
+        prediction['created_at'] = prediction['timestamp']
+        return prediction
@@ -1,218 +1,398 @@
 import sqlite3
 import os
 import hashlib
-import time
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
-class Database:
-    def __init__(self):
-        # Create database directory if it doesn't exist
-        if not os.path.exists('data'):
-            os.makedirs('data')
-        
-        self.db_path = 'data/dr_detection.db'
-        self.conn = None
-        self.cursor = None
-        self._connect()
-        self._create_tables()
-    
+from migrations import migrate
+
+# Constants
+DEFAULT_DB_PATH = 'data/dr_detection.db'
+BUSY_TIMEOUT_SECONDS = 10
+MAX_CONNECTIONS = 8
+
+
+class ConnectionPool:
+    """Bounded pool of WAL-mode SQLite connections shared by all threads in the process."""
+
+    def __init__(self, db_path, max_connections=MAX_CONNECTIONS, timeout=BUSY_TIMEOUT_SECONDS):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
     def _connect(self):
-        """Connect to the SQLite database."""
+        """Open a new connection with the pool's pragmas applied."""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Check a connection out of the pool for the duration of the block."""
+        self._slots.acquire()
         try:
-            self.conn = sqlite3.connect(self.db_path)
-            self.conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-            self.cursor = self.conn.cursor()
-        except sqlite3.Error as e:
-            print(f"Database connection error: {str(e)}")
-    
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+
+            try:
+                yield conn
+            finally:
+                # Never hand an open transaction to the next user
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Close all idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_initialized_paths = set()
+_pools_lock = threading.Lock()
+_schema_lock = threading.Lock()
+
+def get_pool(db_path):
+    """Return the process-wide connection pool for db_path."""
+    with _pools_lock:
+        if db_path not in _pools:
+            _pools[db_path] = ConnectionPool(db_path)
+        return _pools[db_path]
+
+
+class Database:
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        # Create database directory if it doesn't exist
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+
+        # Schema setup only needs to happen once per process; other threads
+        # wait for it rather than writing to a half-migrated database
+        with _schema_lock:
+            if db_path not in _initialized_paths:
+                self._create_tables()
+                _initialized_paths.add(db_path)
+
+    @contextmanager
+    def _transaction(self, immediate=False):
+        """Yield a cursor inside a short transaction; commit on success, roll back on error."""
+        with self.pool.connection() as conn:
+            # Take the write lock up front when reads must not go stale before the commit
+            if immediate:
+                conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn.cursor()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _fetchone(self, query, params=()):
+        """Run a read-only query and return the first row."""
+        with self.pool.connection() as conn:
+            return conn.execute(query, params).fetchone()
+
+    def _fetchall(self, query, params=()):
+        """Run a read-only query and return all rows."""
+        with self.pool.connection() as conn:
+            return conn.execute(query, params).fetchall()
+
     def _create_tables(self):
-        """Create tables if they don't exist."""
-        try:
-            # Users table
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                full_name TEXT,
-                created_at TEXT NOT NULL,
-                last_login TEXT
-            )
-            ''')
-            
-            # Predictions table
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS predictions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                image_path TEXT NOT NULL,
-                predicted_class TEXT NOT NULL,
-                confidence REAL NOT NULL,
-                timestamp TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-            ''')
-            
-            self.conn.commit()
-            
-            # Create a default admin user if no users exist
-            self.cursor.execute("SELECT COUNT(*) FROM users")
-            if self.cursor.fetchone()[0] == 0:
-                self.create_user("admin", "admin@example.com", "admin123", "Administrator")
-                
+        """Create or upgrade the schema to the current version."""
+        try:
+            with self.pool.connection() as conn:
+                migrate(conn)
+
+            self._create_default_user()
+
         except sqlite3.Error as e:
             print(f"Table creation error: {str(e)}")
-    
+
+    def _create_default_user(self):
+        """Create a default admin user if no users exist."""
+        if self._fetchone("SELECT COUNT(*) FROM users")[0] == 0:
+            self.create_user("admin", "admin@example.com", "admin123", "Administrator")
+
     def _hash_password(self, password):
         """Hash a password with SHA-256."""
         return hashlib.sha256(password.encode()).hexdigest()
-    
+
     def create_user(self, username, email, password, full_name=None):
         """Create a new user."""
         try:
             password_hash = self._hash_password(password)
             created_at = datetime.now().isoformat()
-            
-            self.cursor.execute(
-                "INSERT INTO users (username, email, password_hash, full_name, created_at) VALUES (?, ?, ?, ?, ?)",
-                (username, email, password_hash, full_name, created_at)
-            )
-            self.conn.commit()
+
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "INSERT INTO users (username, email, password_hash, full_name, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (username, email, password_hash, full_name, created_at)
+                )
             return True
         except sqlite3.IntegrityError:
             raise Exception("Username or email already exists")
         except sqlite3.Error as e:
             print(f"User creation error: {str(e)}")
             return False
-    
+
     def authenticate_user(self, username, password):
         """Authenticate a user."""
         try:
             password_hash = self._hash_password(password)
-            
-            self.cursor.execute(
-                "SELECT * FROM users WHERE username = ? AND password_hash = ?",
-                (username, password_hash)
-            )
-            user = self.cursor.fetchone()
-            
-            if user:
-                # Update last login time
-                self.cursor.execute(
-                    "UPDATE users SET last_login = ? WHERE id = ?",
-                    (datetime.now().isoformat(), user['id'])
+
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "SELECT * FROM users WHERE username = ? AND password_hash = ?",
+                    (username, password_hash)
                 )
-                self.conn.commit()
-                
-                # Convert SQLite Row to dict
-                return dict(user)
-            
-            return None
+                user = cursor.fetchone()
+
+                if user:
+                    # Update last login time
+                    cursor.execute(
+                        "UPDATE users SET last_login = ? WHERE id = ?",
+                        (datetime.now().isoformat(), user['id'])
+                    )
+
+            # Convert SQLite Row to dict
+            return dict(user) if user else None
         except sqlite3.Error as e:
             print(f"Authentication error: {str(e)}")
             return None
-    
-    def save_prediction(self, user_id, image_path, predicted_class, confidence):
-        """Save a prediction result."""
+
+    def save_prediction(self, user_id, image_path, predicted_class, confidence, probabilities=None, model_version=None):
+        """Save a prediction result with its float32 probability bytes and model version."""
         try:
             timestamp = datetime.now().isoformat()
-            
-            self.cursor.execute(
-                "INSERT INTO predictions (user_id, image_path, predicted_class, confidence, timestamp) VALUES (?, ?, ?, ?, ?)",
-                (user_id, image_path, predicted_class, confidence, timestamp)
-            )
-            self.conn.commit()
+
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "INSERT INTO predictions (user_id, image_path, predicted_class, confidence, timestamp, probabilities, model_version) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (user_id, image_path, predicted_class, confidence, timestamp, probabilities, model_version)
+                )
             return True
         except sqlite3.Error as e:
             print(f"Save prediction error: {str(e)}")
             return False
-    
-    def get_user_predictions(self, user_id):
-        """Get all predictions for a user."""
+
+    def save_predictions(self, user_id, predictions, model_version=None):
+        """Save (image_path, predicted_class, confidence, probabilities) rows in one transaction."""
         try:
-            self.cursor.execute(
-                "SELECT * FROM predictions WHERE user_id = ? ORDER BY timestamp DESC",
-                (user_id,)
-            )
-            predictions = self.cursor.fetchall()
-            
+            timestamp = datetime.now().isoformat()
+            rows = [
+                (user_id, image_path, predicted_class, confidence, timestamp, probabilities, model_version)
+                for image_path, predicted_class, confidence, probabilities in predictions
+            ]
+
+            with self._transaction() as cursor:
+                cursor.executemany(
+                    "INSERT INTO predictions (user_id, image_path, predicted_class, confidence, timestamp, probabilities, model_version) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"Save predictions error: {str(e)}")
+            return False
+
+    def get_user_predictions(self, user_id, after=None, limit=None):
+        """Get predictions for a user, newest first, optionally one page after a (timestamp, id) cursor."""
+        try:
+            query = "SELECT * FROM predictions WHERE user_id = ?"
+            params = [user_id]
+
+            if after is not None:
+                query += " AND (timestamp, id) < (?, ?)"
+                params.extend(after)
+
+            query += " ORDER BY timestamp DESC, id DESC"
+
+            if limit is not None:
+                query += " LIMIT ?"
+                params.append(limit)
+
+            predictions = self._fetchall(query, tuple(params))
+
             # Convert SQLite Rows to dicts
             return [dict(pred) for pred in predictions]
         except sqlite3.Error as e:
             print(f"Get predictions error: {str(e)}")
             return []
-    
+
+    def get_user_summary(self, user_id):
+        """Get scan count, latest scan time and per-class counts for a user from the summary table."""
+        summary = {'total_scans': 0, 'last_timestamp': None, 'class_counts': {}}
+        query = "SELECT predicted_class, scan_count, last_timestamp FROM user_prediction_summary WHERE user_id = ?"
+        try:
+            rows = self._fetchall(query, (user_id,))
+            if not rows and self._fetchone("SELECT 1 FROM predictions WHERE user_id = ? LIMIT 1", (user_id,)):
+                self.rebuild_user_summary(user_id)
+                rows = self._fetchall(query, (user_id,))
+        except sqlite3.Error as e:
+            print(f"Get summary error: {str(e)}")
+            return summary
+
+        for row in rows:
+            summary['class_counts'][row['predicted_class']] = row['scan_count']
+            summary['total_scans'] += row['scan_count']
+            if row['last_timestamp'] and (summary['last_timestamp'] is None or row['last_timestamp'] > summary['last_timestamp']):
+                summary['last_timestamp'] = row['last_timestamp']
+        return summary
+
+    def rebuild_user_summary(self, user_id):
+        """Recompute a user's summary rows from predictions with one GROUP BY query."""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("DELETE FROM user_prediction_summary WHERE user_id = ?", (user_id,))
+                cursor.execute(
+                    """
+                    INSERT INTO user_prediction_summary (user_id, predicted_class, scan_count, last_timestamp)
+                    SELECT user_id, predicted_class, COUNT(*), MAX(timestamp)
+                    FROM predictions
+                    WHERE user_id = ?
+                    GROUP BY predicted_class
+                    """,
+                    (user_id,)
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"Rebuild summary error: {str(e)}")
+            return False
+
+    def release_image(self, image_path, release):
+        """Call release(image_path, reference_count) under the write lock, so no new reference is saved in between."""
+        try:
+            with self._transaction(immediate=True) as cursor:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM predictions WHERE image_path = ?",
+                    (image_path,)
+                )
+                return release(image_path, cursor.fetchone()[0])
+        except sqlite3.Error as e:
+            # Leave the image in place so it is never deleted by mistake
+            print(f"Release image error: {str(e)}")
+            return False
+
+    def get_cached_prediction(self, image_hash, model_fingerprint):
+        """Get a cached probability vector (float32 bytes) or None."""
+        try:
+            row = self._fetchone(
+                "SELECT probabilities FROM prediction_cache WHERE image_hash = ? AND model_fingerprint = ?",
+                (image_hash, model_fingerprint)
+            )
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            print(f"Prediction cache lookup error: {str(e)}")
+            return None
+
+    def cache_prediction(self, image_hash, model_fingerprint, probabilities):
+        """Store a probability vector (float32 bytes) in the prediction cache."""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "INSERT OR REPLACE INTO prediction_cache (image_hash, model_fingerprint, probabilities, created_at) VALUES (?, ?, ?, ?)",
+                    (image_hash, model_fingerprint, probabilities, datetime.now().isoformat())
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"Prediction cache store error: {str(e)}")
+            return False
+
+    def purge_prediction_cache(self, model_file_hash):
+        """Remove cached predictions whose model fingerprint does not start with model_file_hash."""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "DELETE FROM prediction_cache WHERE substr(model_fingerprint, 1, length(?)) != ?",
+                    (model_file_hash, model_file_hash)
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"Prediction cache purge error: {str(e)}")
+            return False
+
     def delete_prediction(self, prediction_id):
         """Delete a prediction."""
         try:
-            self.cursor.execute(
-                "DELETE FROM predictions WHERE id = ?",
-                (prediction_id,)
-            )
-            self.conn.commit()
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "DELETE FROM predictions WHERE id = ?",
+                    (prediction_id,)
+                )
             return True
         except sqlite3.Error as e:
             print(f"Delete prediction error: {str(e)}")
             return False
-    
+
     def update_user_profile(self, user_id, full_name, email):
         """Update user profile."""
         try:
-            self.cursor.execute(
-                "UPDATE users SET full_name = ?, email = ? WHERE id = ?",
-                (full_name, email, user_id)
-            )
-            self.conn.commit()
-            
-            # Return updated user
-            self.cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-            return dict(self.cursor.fetchone())
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "UPDATE users SET full_name = ?, email = ? WHERE id = ?",
+                    (full_name, email, user_id)
+                )
+
+                # Return updated user
+                cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+                return dict(cursor.fetchone())
         except sqlite3.Error as e:
             print(f"Update profile error: {str(e)}")
             return None
-    
+
     def update_user_password(self, user_id, current_password, new_password):
         """Update user password."""
         try:
             current_hash = self._hash_password(current_password)
-            
-            # Verify current password
-            self.cursor.execute(
-                "SELECT id FROM users WHERE id = ? AND password_hash = ?",
-                (user_id, current_hash)
-            )
-            
-            if not self.cursor.fetchone():
-                return False  # Current password is incorrect
-            
-            # Update password
             new_hash = self._hash_password(new_password)
-            self.cursor.execute(
-                "UPDATE users SET password_hash = ? WHERE id = ?",
-                (new_hash, user_id)
-            )
-            self.conn.commit()
+
+            with self._transaction() as cursor:
+                # Verify current password
+                cursor.execute(
+                    "SELECT id FROM users WHERE id = ? AND password_hash = ?",
+                    (user_id, current_hash)
+                )
+
+                if not cursor.fetchone():
+                    return False  # Current password is incorrect
+
+                # Update password
+                cursor.execute(
+                    "UPDATE users SET password_hash = ? WHERE id = ?",
+                    (new_hash, user_id)
+                )
             return True
         except sqlite3.Error as e:
             print(f"Password update error: {str(e)}")
             return False
-    
+
     def delete_user(self, user_id):
         """Delete a user and all associated predictions."""
         try:
-            # Delete predictions first (foreign key constraint)
-            self.cursor.execute("DELETE FROM predictions WHERE user_id = ?", (user_id,))
-            
-            # Delete user
-            self.cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-            self.conn.commit()
+            with self._transaction() as cursor:
+                # Delete predictions first (foreign key constraint)
+                cursor.execute("DELETE FROM predictions WHERE user_id = ?", (user_id,))
+
+                # Delete user
+                cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
             return True
         except sqlite3.Error as e:
             print(f"Delete user error: {str(e)}")
             return False
-    
-    def __del__(self):
-        """Close database connection when object is destroyed."""
-        if self.conn:
-            self.conn.close()
\ No newline at end of file
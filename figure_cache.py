@@ -0,0 +1,45 @@
+import threading
+from collections import OrderedDict
+
+
+class FigureCache:
+    """Per-user LRU cache of built Plotly figures.
+
+    Each entry is stored with a version (for the history chart, the user's
+    scan count and latest scan time from the summary table), so a figure is
+    rebuilt whenever predictions are added or deleted, even by another
+    session. Callers that change a user's predictions also invalidate the
+    entry directly.
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version, build):
+        """Return the cached figure for user_id at version, calling build() on a miss."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        figure = build()
+        with self._lock:
+            self._entries[user_id] = (version, figure)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return figure
+
+    def invalidate(self, user_id=None):
+        """Drop one user's figure, or all of them."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+history_figure_cache = FigureCache()
@@ -0,0 +1,42 @@
+import os
+import threading
+
+
+class FileCache:
+    """Process-wide cache of parsed small files (stylesheets, JSON).
+
+    Each lookup costs one ``os.stat``; the file is read and parsed again only
+    when its mtime or size changes. Entries are keyed by path, so each file
+    should always be read with the same parser. A missing file raises
+    FileNotFoundError, so callers can create it and look it up again.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, parse=lambda text: text):
+        """Return parse(contents of path), reusing the last result while the file is unchanged."""
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        with open(path, 'r') as f:
+            value = parse(f.read())
+        with self._lock:
+            self._entries[path] = (version, value)
+        return value
+
+    def invalidate(self, path=None):
+        """Drop one cached file, or all of them."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+
+file_cache = FileCache()
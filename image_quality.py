@@ -0,0 +1,141 @@
+import cv2
+import numpy as np
+from PIL import Image
+
+# Constants
+MIN_IMAGE_SIDE = 150
+ANALYSIS_SIDE = 256
+FRAME_MARGIN_DIVISOR = 40
+BACKGROUND_TOLERANCE = 40
+MIN_FOV_FRACTION = 0.2
+MIN_FOV_ROUNDNESS = 0.8
+MIN_SHARPNESS = 20.0
+MIN_BRIGHTNESS = 20
+MAX_BRIGHTNESS = 220
+MAX_CLIPPED_FRACTION = 0.25
+
+
+def _analysis_array(img):
+    """Return (rgb, scale, margin): img as an RGB uint8 array with its longer side scaled to ANALYSIS_SIDE.
+
+    Sharpness depends on scale, so every image is measured at the same size.
+    A thin margin is trimmed, since screenshots and scans of fundus photos
+    often carry a frame that would be mistaken for the background.
+    """
+    rgb = np.asarray(img.convert('RGB') if isinstance(img, Image.Image) else img)
+    height, width = rgb.shape[:2]
+    scale = ANALYSIS_SIDE / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    rgb = cv2.resize(rgb, size, interpolation=interpolation)
+    margin = min(rgb.shape[:2]) // FRAME_MARGIN_DIVISOR
+    return rgb[margin:rgb.shape[0] - margin, margin:rgb.shape[1] - margin], scale, margin
+
+def find_field_of_view(rgb):
+    """Return (mask, roundness) of the retinal disc in an RGB array.
+
+    The background colour is taken from the image corners, which must be
+    plain, so the disc is found on black or white backgrounds alike but
+    solid fills and full-frame photos have none. Roundness is the share of
+    the disc's minimum enclosing circle (clipped to the image) the disc
+    fills: close to 1 for a fundus photo, even when the circle is cut off at
+    the top and bottom.
+    """
+    patch = max(2, min(rgb.shape[:2]) // 20)
+    corners = np.concatenate([
+        rgb[:patch, :patch], rgb[:patch, -patch:], rgb[-patch:, :patch], rgb[-patch:, -patch:]
+    ]).reshape(-1, 3)
+    background = np.median(corners, axis=0)
+
+    # Without a plain background around it there is no disc to find
+    if np.mean(np.abs(corners.astype(np.int16) - background).max(axis=1) <= BACKGROUND_TOLERANCE) < 0.9:
+        return np.zeros(rgb.shape[:2], dtype=bool), 0.0
+
+    mask = (np.abs(rgb.astype(np.int16) - background).max(axis=2) > BACKGROUND_TOLERANCE).astype(np.uint8)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return mask.astype(bool), 0.0
+
+    disc = max(contours, key=cv2.contourArea)
+    fov = np.zeros_like(mask)
+    cv2.drawContours(fov, [disc], -1, 1, thickness=cv2.FILLED)
+
+    (x, y), radius = cv2.minEnclosingCircle(disc)
+    circle = np.zeros_like(mask)
+    cv2.circle(circle, (round(x), round(y)), round(radius), 1, thickness=cv2.FILLED)
+    return fov.astype(bool), float(fov.sum() / max(circle.sum(), 1))
+
+def field_of_view_box(img):
+    """Return the (left, top, right, bottom) box around the retinal disc in img's pixels, or None."""
+    rgb, scale, margin = _analysis_array(img)
+    fov, roundness = find_field_of_view(rgb)
+    if fov.mean() < MIN_FOV_FRACTION or roundness < MIN_FOV_ROUNDNESS:
+        return None
+
+    rows = np.flatnonzero(fov.any(axis=1))
+    columns = np.flatnonzero(fov.any(axis=0))
+    width, height = img.size if isinstance(img, Image.Image) else img.shape[1::-1]
+    return (
+        max(0, int((columns[0] + margin) / scale)),
+        max(0, int((rows[0] + margin) / scale)),
+        min(width, int(np.ceil((columns[-1] + 1 + margin) / scale))),
+        min(height, int(np.ceil((rows[-1] + 1 + margin) / scale))),
+    )
+
+def check_image_quality(img, original_size=None):
+    """Check that an image is a usable fundus photo before it is scored.
+
+    img may be a PIL image or an RGB array, at any resolution (a preview is
+    enough); original_size is the (width, height) of the full upload when img
+    has been downscaled. Returns a dict with 'passed', a list of
+    human-readable 'issues' and the measured 'metrics'.
+    """
+    width, height = original_size or (img.size if isinstance(img, Image.Image) else img.shape[1::-1])
+    rgb, _, _ = _analysis_array(img)
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    fov, roundness = find_field_of_view(rgb)
+    fov_fraction = float(fov.mean())
+
+    metrics = {
+        'width': width,
+        'height': height,
+        'fov_fraction': fov_fraction,
+        'fov_roundness': roundness,
+        'brightness': None,
+        'clipped_fraction': None,
+        'sharpness': None,
+    }
+    issues = []
+
+    if min(width, height) < MIN_IMAGE_SIDE:
+        issues.append(f"resolution {width}x{height} is below the {MIN_IMAGE_SIDE}px minimum")
+
+    if fov_fraction < MIN_FOV_FRACTION or roundness < MIN_FOV_ROUNDNESS:
+        # A badly underexposed disc blends into the background
+        if gray.mean() < MIN_BRIGHTNESS:
+            issues.append("the image is too dark")
+        else:
+            issues.append("no circular retinal field of view was found")
+        return {'passed': False, 'issues': issues, 'metrics': metrics}
+
+    # Exposure and sharpness are measured inside the disc only; the rim is
+    # eroded away so its edge does not count as detail
+    inner = cv2.erode(fov.astype(np.uint8), np.ones((5, 5), np.uint8)).astype(bool)
+    if not inner.any():
+        inner = fov
+    pixels = gray[inner]
+    metrics['brightness'] = float(pixels.mean())
+    metrics['clipped_fraction'] = float(np.mean((pixels <= 5) | (pixels >= 250)))
+    metrics['sharpness'] = float(cv2.Laplacian(gray, cv2.CV_64F)[inner].var())
+
+    if metrics['brightness'] < MIN_BRIGHTNESS:
+        issues.append("the image is too dark")
+    elif metrics['brightness'] > MAX_BRIGHTNESS:
+        issues.append("the image is overexposed")
+    if metrics['clipped_fraction'] > MAX_CLIPPED_FRACTION:
+        issues.append("too much of the retina is clipped to black or white")
+    if metrics['sharpness'] < MIN_SHARPNESS:
+        issues.append("the image is too blurry")
+
+    return {'passed': not issues, 'issues': issues, 'metrics': metrics}
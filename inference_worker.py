@@ -0,0 +1,235 @@
+import os
+import queue
+import atexit
+import itertools
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future, wait
+import numpy as np
+
+from batching import collect_batch, STOP as _STOP
+from model_registry import MODEL_PATH
+from serving_config import load_serving_config
+from tflite_backend import get_serving_model_path
+
+# Sent by a worker once its model is loaded
+_READY = 'ready'
+
+# How often the collector checks for dead workers, and how many times in
+# the pool's lifetime a dead worker is replaced before the pool gives up
+WORKER_CHECK_INTERVAL_S = 1.0
+MAX_WORKER_RESTARTS = 3
+
+
+def worker_cpus(index, workers, cpus=None):
+    """Return the slice of cpus (default: all available) that worker index should run on."""
+    cpus = sorted(cpus if cpus is not None else os.sched_getaffinity(0))
+    per_worker = max(1, len(cpus) // workers)
+    start = (index * per_worker) % len(cpus)
+    return cpus[start:start + per_worker]
+
+def _worker_main(model_path, requests, results, max_batch_size, max_wait_ms, cpus=None):
+    """Inference worker process: load the model once, then serve micro-batches."""
+    # Pin before TensorFlow starts its thread pools
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+    from model_registry import registry
+
+    # Load and warm up before taking any work
+    registry.get(model_path)
+    results.put(_READY)
+
+    stop = False
+    while not stop:
+        batch, stop = collect_batch(requests, max_batch_size, max_wait_ms)
+        if not batch:
+            continue
+
+        request_ids = [request_id for request_id, _ in batch]
+        try:
+            inputs = np.stack([image for _, image in batch])
+            probabilities = registry.get(model_path).predict(inputs, batch_size=len(batch), verbose=0)
+            results.put([(request_id, probs, None) for request_id, probs in zip(request_ids, probabilities)])
+        except Exception as e:
+            results.put([(request_id, None, str(e)) for request_id in request_ids])
+
+
+class InferencePool:
+    """Pool of inference processes fed from one shared request queue.
+
+    Each worker pulls requests from the queue and batches whatever arrives
+    within max_wait_ms (up to max_batch_size) into one forward pass, so
+    concurrent sessions share batches. submit() returns a Future per image;
+    predict() mirrors Keras ``model.predict`` so callers can use either.
+    A worker that dies fails every outstanding request and is replaced, up
+    to MAX_WORKER_RESTARTS times.
+    """
+
+    def __init__(self, workers=2, model_path=MODEL_PATH, max_batch_size=32, max_wait_ms=5,
+                 request_timeout_s=60, pin_workers=False):
+        self.request_timeout_s = request_timeout_s
+
+        # Spawn rather than fork: TensorFlow is not fork-safe
+        self._context = mp.get_context('spawn')
+        self._requests = self._context.Queue()
+        self._results = self._context.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._ready = threading.Event()
+        self._failed = threading.Event()
+        self._error = None
+        self._closed = False
+        self._restarts = 0
+
+        self._worker_args = [
+            (model_path, self._requests, self._results, max_batch_size, max_wait_ms,
+             worker_cpus(index, workers) if pin_workers else None)
+            for index in range(workers)
+        ]
+        self._processes = [self._start_worker(index) for index in range(workers)]
+
+        self._collector = threading.Thread(target=self._collect_results, daemon=True)
+        self._collector.start()
+
+    def _start_worker(self, index):
+        """Start the process for worker slot index."""
+        process = self._context.Process(target=_worker_main, args=self._worker_args[index], daemon=True)
+        process.start()
+        return process
+
+    def _collect_results(self):
+        """Resolve futures as workers send results back, and watch for dead workers."""
+        while True:
+            try:
+                message = self._results.get(timeout=WORKER_CHECK_INTERVAL_S)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            except (EOFError, OSError):
+                # The queue was closed under us at interpreter exit
+                break
+            if message is _STOP:
+                break
+            if message == _READY:
+                self._ready.set()
+                continue
+
+            for request_id, probabilities, error in message:
+                with self._lock:
+                    future = self._pending.pop(request_id, None)
+                if future is None:
+                    continue
+                if error is None:
+                    future.set_result(probabilities)
+                else:
+                    future.set_exception(RuntimeError(f"Inference worker error: {error}"))
+            self._check_workers()
+
+    def _check_workers(self):
+        """Fail outstanding requests if a worker died, then replace it or give up."""
+        for index, process in enumerate(self._processes):
+            if process is None or process.is_alive() or self._closed:
+                continue
+
+            # Requests come from a shared queue, so there is no telling which
+            # ones the dead worker had taken
+            error = f"Inference worker {index} exited with code {process.exitcode}"
+            print(error)
+            self._fail_pending(error)
+
+            if self._restarts < MAX_WORKER_RESTARTS:
+                self._restarts += 1
+                self._processes[index] = self._start_worker(index)
+            else:
+                self._processes[index] = None
+
+        if all(process is None for process in self._processes):
+            self._error = f"All inference workers exited after {self._restarts} restarts"
+            self._failed.set()
+            self._fail_pending(self._error)
+
+    def _fail_pending(self, error):
+        """Fail every request still waiting for a result."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError(error))
+
+    def wait_until_ready(self, timeout=None):
+        """Block until at least one worker has loaded and warmed up the model.
+
+        Raises RuntimeError if every worker has died for good.
+        """
+        wait_timeout = min(timeout, WORKER_CHECK_INTERVAL_S) if timeout is not None else WORKER_CHECK_INTERVAL_S
+        waited = 0.0
+        while not self._ready.wait(wait_timeout):
+            if self._failed.is_set():
+                raise RuntimeError(self._error)
+            waited += wait_timeout
+            if timeout is not None and waited >= timeout:
+                return False
+        return True
+
+    def _submit(self, image):
+        """Queue one image and return (request_id, future)."""
+        if self._failed.is_set():
+            raise RuntimeError(self._error)
+        future = Future()
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+        self._requests.put((request_id, np.asarray(image, dtype=np.float32)))
+        return request_id, future
+
+    def submit(self, image):
+        """Queue one preprocessed (H, W, 3) image; the Future yields its probability vector."""
+        return self._submit(image)[1]
+
+    def predict(self, images, batch_size=None, verbose=0):
+        """Score a (N, H, W, 3) array and return (N, num_classes) probabilities."""
+        requests = [self._submit(image) for image in images]
+        futures = [future for _, future in requests]
+        _, not_done = wait(futures, timeout=self.request_timeout_s)
+        if not_done:
+            # Forget the requests so late results are dropped instead of piling up
+            with self._lock:
+                for request_id, _ in requests:
+                    self._pending.pop(request_id, None)
+            raise TimeoutError(f"Inference did not finish within {self.request_timeout_s}s")
+        return np.stack([future.result() for future in futures])
+
+    def shutdown(self, timeout=5):
+        """Stop the workers and the result collector."""
+        self._closed = True
+        processes = [process for process in self._processes if process is not None]
+        for _ in processes:
+            self._requests.put(_STOP)
+        for process in processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._results.put(_STOP)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_inference_pool():
+    """Return the process-wide inference pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = load_serving_config()
+            settings = config['inference']
+            _pool = InferencePool(
+                workers=settings['workers'],
+                model_path=get_serving_model_path(settings),
+                max_batch_size=settings['max_batch_size'],
+                max_wait_ms=settings['max_wait_ms'],
+                request_timeout_s=settings['request_timeout_s'],
+                pin_workers=config['threading']['pin_workers'],
+            )
+            atexit.register(_pool.shutdown)
+        return _pool
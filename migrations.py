@@ -0,0 +1,295 @@
+"""Versioned schema migrations for the application database.
+
+The schema version is kept in SQLite's ``PRAGMA user_version``. Each
+migration is a function ``migration(cursor, batch_size)`` that runs inside
+a short ``BEGIN IMMEDIATE`` transaction and returns True when it is done;
+one that returns False is called again in a new transaction, so work over
+large tables is split into batches and readers and writers get the
+database between them. ``user_version`` is bumped in the same transaction
+as the migration's last step, which makes an interrupted upgrade resume
+where it stopped.
+
+Databases created before versioning (user_version 0) may come from either
+the old ``db_module`` layout (``prediction_class`` / ``created_at``) or an
+unversioned ``db_module_1`` one, so the migrations tolerate objects that
+already exist.
+
+    python migrations.py data/dr_detection.db
+    python migrations.py diabetic_retinopathy.db --batch-size 100000
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+# Constants
+MIGRATION_BATCH_SIZE = 50000
+# Waiting writers retry on SQLite's busy-handler schedule (up to 100 ms
+# apart), so batches are spaced out enough for them to get a turn
+MIGRATION_BATCH_PAUSE_SECONDS = 0.1
+
+
+@contextmanager
+def _immediate_transaction(conn):
+    """Yield a cursor inside a write transaction taken up front; commit on success, roll back on error."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn.cursor()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def _columns(cursor, table):
+    """Return the column names of table (empty if it does not exist)."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+def _table_exists(cursor, table):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+def get_schema_version(conn):
+    """Return the schema version recorded in the database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _create_base_schema(cursor, batch_size):
+    """Users, predictions and prediction cache tables.
+
+    Legacy db_module predictions tables have their columns renamed in place;
+    RENAME COLUMN only rewrites the schema, not the rows.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        full_name TEXT,
+        created_at TEXT NOT NULL,
+        last_login TEXT
+    )
+    ''')
+    if 'last_login' not in _columns(cursor, 'users'):
+        cursor.execute("ALTER TABLE users ADD COLUMN last_login TEXT")
+
+    prediction_columns = _columns(cursor, 'predictions')
+    if 'prediction_class' in prediction_columns:
+        cursor.execute("ALTER TABLE predictions RENAME COLUMN prediction_class TO predicted_class")
+    if 'created_at' in prediction_columns:
+        cursor.execute("ALTER TABLE predictions RENAME COLUMN created_at TO timestamp")
+    cursor.execute("DROP INDEX IF EXISTS idx_predictions_user_created")
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS predictions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        image_path TEXT NOT NULL,
+        predicted_class TEXT NOT NULL,
+        confidence REAL NOT NULL,
+        timestamp TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+
+    # Probability vectors keyed by image content and model version
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS prediction_cache (
+        image_hash TEXT NOT NULL,
+        model_fingerprint TEXT NOT NULL,
+        probabilities BLOB NOT NULL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (image_hash, model_fingerprint)
+    )
+    ''')
+    return True
+
+def _add_probability_columns(cursor, batch_size):
+    """Full probability vector (float32 BLOB) and model version per prediction; old rows keep NULL."""
+    prediction_columns = _columns(cursor, 'predictions')
+    for column, column_type in (('probabilities', 'BLOB'), ('model_version', 'TEXT')):
+        if column not in prediction_columns:
+            cursor.execute(f"ALTER TABLE predictions ADD COLUMN {column} {column_type}")
+    return True
+
+def _create_history_index(cursor, batch_size):
+    """Index for History pages, which filter by user and walk newest first.
+
+    id is the tie-breaker for the keyset cursor. SQLite builds an index in
+    one statement, so each index gets its own step to keep every write lock
+    as short as possible.
+    """
+    cursor.execute("DROP INDEX IF EXISTS idx_predictions_user_timestamp")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_predictions_user_timestamp_id ON predictions (user_id, timestamp DESC, id DESC)"
+    )
+    return True
+
+def _create_image_path_index(cursor, batch_size):
+    """Index for lookups by image path, which back the upload reference counts."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_predictions_image_path ON predictions (image_path)")
+    return True
+
+def _create_user_summary(cursor, batch_size):
+    """Per-user, per-class scan counts, kept current by triggers and backfilled in id ranges.
+
+    The triggers are created with the table, so every later insert or delete
+    is counted whichever version of the application makes it; rows up to the
+    highest id present at that moment are backfilled here, batch_size ids per
+    transaction. A summary left by an unversioned db_module_1 is rebuilt.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS migration_progress (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL,
+        max_id INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute("SELECT last_id, max_id FROM migration_progress WHERE name = 'user_prediction_summary'")
+    progress = cursor.fetchone()
+
+    if progress is None:
+        cursor.execute("DROP TABLE IF EXISTS user_prediction_summary")
+        cursor.execute('''
+        CREATE TABLE user_prediction_summary (
+            user_id INTEGER NOT NULL,
+            predicted_class TEXT NOT NULL,
+            scan_count INTEGER NOT NULL,
+            last_timestamp TEXT,
+            PRIMARY KEY (user_id, predicted_class)
+        )
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS predictions_summary_insert AFTER INSERT ON predictions
+        BEGIN
+            INSERT INTO user_prediction_summary (user_id, predicted_class, scan_count, last_timestamp)
+            VALUES (NEW.user_id, NEW.predicted_class, 1, NEW.timestamp)
+            ON CONFLICT (user_id, predicted_class) DO UPDATE SET
+                scan_count = scan_count + 1,
+                last_timestamp = MAX(COALESCE(last_timestamp, ''), excluded.last_timestamp);
+        END
+        ''')
+        # Rows the backfill has not reached yet were never counted, so deleting
+        # them must not uncount anything. The latest timestamp is only looked up
+        # again when the deleted row was the latest, which keeps bulk deletes linear
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS predictions_summary_delete AFTER DELETE ON predictions
+        WHEN NOT EXISTS (
+            SELECT 1 FROM migration_progress
+            WHERE name = 'user_prediction_summary' AND OLD.id > last_id AND OLD.id <= max_id
+        )
+        BEGIN
+            DELETE FROM user_prediction_summary
+            WHERE user_id = OLD.user_id AND predicted_class = OLD.predicted_class AND scan_count <= 1;
+            UPDATE user_prediction_summary
+            SET scan_count = scan_count - 1,
+                last_timestamp = CASE WHEN OLD.timestamp >= last_timestamp THEN (
+                    SELECT MAX(timestamp) FROM predictions
+                    WHERE user_id = OLD.user_id AND predicted_class = OLD.predicted_class
+                ) ELSE last_timestamp END
+            WHERE user_id = OLD.user_id AND predicted_class = OLD.predicted_class;
+        END
+        ''')
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM predictions")
+        last_id, max_id = 0, cursor.fetchone()[0]
+        cursor.execute(
+            "INSERT INTO migration_progress (name, last_id, max_id) VALUES ('user_prediction_summary', 0, ?)",
+            (max_id,)
+        )
+    else:
+        last_id, max_id = progress
+
+    upper = min(last_id + batch_size, max_id)
+    cursor.execute(
+        """
+        INSERT INTO user_prediction_summary (user_id, predicted_class, scan_count, last_timestamp)
+        SELECT user_id, predicted_class, COUNT(*), MAX(timestamp)
+        FROM predictions
+        WHERE id > ? AND id <= ?
+        GROUP BY user_id, predicted_class
+        ON CONFLICT (user_id, predicted_class) DO UPDATE SET
+            scan_count = scan_count + excluded.scan_count,
+            last_timestamp = MAX(COALESCE(last_timestamp, ''), excluded.last_timestamp)
+        """,
+        (last_id, upper)
+    )
+
+    if upper >= max_id:
+        cursor.execute("DELETE FROM migration_progress WHERE name = 'user_prediction_summary'")
+        return True
+    cursor.execute("UPDATE migration_progress SET last_id = ? WHERE name = 'user_prediction_summary'", (upper,))
+    return False
+
+
+# Applied in order; a database at user_version N has had the first N applied.
+# Append new migrations; never edit or reorder released ones.
+MIGRATIONS = [
+    _create_base_schema,
+    _add_probability_columns,
+    _create_history_index,
+    _create_image_path_index,
+    _create_user_summary,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn, batch_size=MIGRATION_BATCH_SIZE, progress=None):
+    """Bring the database on conn up to SCHEMA_VERSION and return the version it ends at.
+
+    Safe to run from several processes at once: every step re-checks the
+    version inside its own write transaction. progress, if given, is called
+    as progress(version, migration) after each migration is applied.
+    """
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        print(f"Database schema version {version} is newer than this code supports ({SCHEMA_VERSION})")
+        return version
+
+    for target, migration in enumerate(MIGRATIONS, start=1):
+        if target <= version:
+            continue
+
+        done = False
+        while not done:
+            with _immediate_transaction(conn) as cursor:
+                if get_schema_version(conn) >= target:
+                    break
+                done = migration(cursor, batch_size)
+                if done:
+                    cursor.execute(f"PRAGMA user_version = {target}")
+            if not done:
+                time.sleep(MIGRATION_BATCH_PAUSE_SECONDS)
+
+        if progress is not None:
+            progress(target, migration)
+
+    return get_schema_version(conn)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('db_path', help="SQLite database file to upgrade")
+    parser.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE, help="Rows per transaction for backfills")
+    args = parser.parse_args(argv)
+
+    from db_module_1 import get_pool
+
+    started = time.perf_counter()
+
+    def report(version, migration):
+        print(f"[{time.perf_counter() - started:8.1f}s] version {version}: {migration.__doc__.splitlines()[0]}")
+
+    try:
+        with get_pool(args.db_path).connection() as conn:
+            print(f"{args.db_path}: schema version {get_schema_version(conn)}, target {SCHEMA_VERSION}")
+            version = migrate(conn, args.batch_size, progress=report)
+    except sqlite3.Error as e:
+        print(f"Migration error: {str(e)}", file=sys.stderr)
+        return 1
+
+    print(f"{args.db_path}: schema version {version}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+import os
+import hashlib
+import threading
+import numpy as np
+
+from serving_config import load_serving_config
+from utils import atomic_write_path
+
+# TensorFlow is imported on first model load rather than here: it takes
+# seconds, and the login page should not wait for it.
+
+# Constants
+MODEL_DIR = 'model'
+MODEL_PATH = os.path.join(MODEL_DIR, 'model.h5')
+IMAGE_HEIGHT = 150
+IMAGE_WIDTH = 150
+NUM_CLASSES = 4
+
+_tensorflow_configured = False
+
+
+def import_tensorflow(settings=None):
+    """Import TensorFlow, applying the [threading] settings the first time.
+
+    Thread pools and oneDNN can only be configured before TensorFlow starts
+    its runtime, so every TensorFlow import in the serving path goes through
+    here. A value of 0 keeps TensorFlow's default (one thread per core).
+    """
+    global _tensorflow_configured
+    settings = settings or load_serving_config()['threading']
+    os.environ.setdefault('TF_ENABLE_ONEDNN_OPTS', '1' if settings['onednn'] else '0')
+
+    import tensorflow as tf
+    if not _tensorflow_configured:
+        _tensorflow_configured = True
+        try:
+            if settings['intra_op_threads']:
+                tf.config.threading.set_intra_op_parallelism_threads(settings['intra_op_threads'])
+            if settings['inter_op_threads']:
+                tf.config.threading.set_inter_op_parallelism_threads(settings['inter_op_threads'])
+        except RuntimeError as e:
+            print(f"TensorFlow threading error: {str(e)}")
+    return tf
+
+def build_placeholder_model(model_path):
+    """Create and save an untrained placeholder model."""
+    tf = import_tensorflow()
+
+    model = tf.keras.Sequential([
+        tf.keras.layers.InputLayer(input_shape=(IMAGE_HEIGHT, IMAGE_WIDTH, 3)),
+        tf.keras.layers.Conv2D(16, 3, padding='same', activation='relu'),
+        tf.keras.layers.MaxPooling2D(),
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(NUM_CLASSES, activation='softmax')
+    ])
+    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+
+    # Several worker processes may race here; Keras picks the format from the extension
+    with atomic_write_path(model_path, keep_extension=True) as temp_path:
+        model.save(temp_path)
+    return model
+
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def warm_up(model):
+    """Run one dummy prediction so graph tracing happens before real requests."""
+    dummy = np.zeros((1, IMAGE_HEIGHT, IMAGE_WIDTH, 3), dtype=np.float32)
+    model.predict(dummy, verbose=0)
+
+
+class CompiledModel:
+    """Keras model served through a traced tf.function with a fixed input signature.
+
+    ``model.predict`` builds a data adapter and callbacks on every call, which
+    dominates the cost of scoring one image. The signature leaves only the
+    batch dimension open, so the function is traced once and reused for any
+    batch size. With jit_compile the function is XLA-compiled; XLA still
+    compiles once per distinct batch size. The wrapped Keras model is
+    available as ``model``.
+    """
+
+    def __init__(self, model, jit_compile=False):
+        tf = import_tensorflow()
+
+        self.model = model
+        self._tf = tf
+        signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32)]
+        self._forward = tf.function(
+            lambda images: model(images, training=False),
+            input_signature=signature,
+            jit_compile=jit_compile
+        )
+
+    def predict(self, images, batch_size=None, verbose=0):
+        """Score a (N, H, W, 3) array and return (N, num_classes) probabilities."""
+        return self._forward(self._tf.convert_to_tensor(images, dtype=self._tf.float32)).numpy()
+
+
+class _ModelEntry:
+    """A loaded model together with the file state it was loaded from."""
+
+    def __init__(self, model, mtime, size, fingerprint):
+        self.model = model
+        self.mtime = mtime
+        self.size = size
+        self.fingerprint = fingerprint
+
+
+class ModelRegistry:
+    """Process-wide cache that loads each model file once.
+
+    Every lookup does a cheap ``os.stat``; when the file's mtime or size
+    changes the contents are hashed and, if they really differ, the new model
+    is loaded and warmed up before being swapped in. Callers that already
+    hold the previous model keep using it, and concurrent lookups during a
+    reload are served the previous model instead of waiting.
+    """
+
+    def __init__(self, jit_compile=False):
+        self.jit_compile = jit_compile
+        self._entries = {}
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def _load_lock(self, model_path):
+        with self._lock:
+            return self._load_locks.setdefault(model_path, threading.Lock())
+
+    def _source(self, model_path):
+        """Return (file whose changes invalidate model_path, fingerprint suffix).
+
+        A TFLite model is tracked through the Keras model it is converted
+        from, when that file exists, so replacing model.h5 reconverts it.
+        """
+        if model_path.endswith('.tflite'):
+            from tflite_backend import get_source_model_path
+            source_path, quantization = get_source_model_path(model_path)
+            if os.path.exists(source_path):
+                return source_path, f":{quantization}"
+        return model_path, ""
+
+    def _is_current(self, entry, model_path):
+        try:
+            stat = os.stat(self._source(model_path)[0])
+        except OSError:
+            return False
+        return entry.mtime == stat.st_mtime and entry.size == stat.st_size
+
+    def _file_fingerprint(self, model_path):
+        """Hash model_path's source file, reusing the last hash while its mtime and size are unchanged."""
+        source_path, suffix = self._source(model_path)
+        stat = os.stat(source_path)
+        cached = self._fingerprints.get(model_path)
+        if cached is not None and cached[:3] == (source_path, stat.st_mtime, stat.st_size):
+            return stat, cached[3]
+
+        fingerprint = file_fingerprint(source_path) + suffix
+        self._fingerprints[model_path] = (source_path, stat.st_mtime, stat.st_size, fingerprint)
+        return stat, fingerprint
+
+    def _load(self, model_path):
+        """Load (or create) the model at model_path and return a warmed entry."""
+        previous = self._entries.get(model_path)
+
+        model_dir = os.path.dirname(model_path)
+        if model_dir and not os.path.exists(model_dir):
+            os.makedirs(model_dir)
+
+        if model_path.endswith('.tflite'):
+            # Converted from the Keras model on first use; see tflite_backend
+            from tflite_backend import load_tflite_model
+            if previous is not None:
+                stat, fingerprint = self._file_fingerprint(model_path)
+                if previous.fingerprint == fingerprint:
+                    return _ModelEntry(previous.model, stat.st_mtime, stat.st_size, fingerprint)
+            # A reload means the Keras model changed, whatever the file times say
+            model = load_tflite_model(model_path, reconvert=previous is not None)
+        elif not os.path.exists(model_path):
+            model = CompiledModel(build_placeholder_model(model_path), self.jit_compile)
+        else:
+            model = None
+
+        stat, fingerprint = self._file_fingerprint(model_path)
+
+        # Touched but unchanged file: keep the loaded model, refresh the stat
+        if model is None and previous is not None and previous.fingerprint == fingerprint:
+            return _ModelEntry(previous.model, stat.st_mtime, stat.st_size, fingerprint)
+
+        if model is None:
+            tf = import_tensorflow()
+            model = CompiledModel(tf.keras.models.load_model(model_path), self.jit_compile)
+        warm_up(model)
+        return _ModelEntry(model, stat.st_mtime, stat.st_size, fingerprint)
+
+    def _get_entry(self, model_path):
+        entry = self._entries.get(model_path)
+        if entry is not None and self._is_current(entry, model_path):
+            return entry
+
+        load_lock = self._load_lock(model_path)
+        if entry is None:
+            # Nothing to serve yet, so the first caller loads and the rest wait
+            load_lock.acquire()
+        elif not load_lock.acquire(blocking=False):
+            # Another thread is already reloading; keep serving the old model
+            return entry
+
+        try:
+            entry = self._entries.get(model_path)
+            if entry is None or not self._is_current(entry, model_path):
+                entry = self._load(model_path)
+                self._entries[model_path] = entry
+            return entry
+        finally:
+            load_lock.release()
+
+    def get(self, model_path=MODEL_PATH):
+        """Return the loaded model for model_path, reloading it if the file changed."""
+        return self._get_entry(model_path).model
+
+    def fingerprint(self, model_path=MODEL_PATH):
+        """Return the SHA-256 of the model file (for TFLite, of its Keras source plus the quantization mode).
+
+        Lets callers that serve predictions elsewhere (e.g. inference workers)
+        key caches by model version without importing TensorFlow.
+        """
+        return self._file_fingerprint(model_path)[1]
+
+    def preload(self, model_path=MODEL_PATH):
+        """Load and warm up the model in a background thread if not loaded yet."""
+        if model_path in self._entries or self._load_lock(model_path).locked():
+            return None
+        thread = threading.Thread(target=self._get_entry, args=(model_path,), daemon=True)
+        thread.start()
+        return thread
+
+
+# Shared by every Streamlit session in this process
+registry = ModelRegistry(jit_compile=load_serving_config()['inference']['xla'])
@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Fingerprints start with the model file's SHA-256 hex digest; variants of
+# the same file add suffixes such as ":dynamic" (TFLite) or "+enhanced"
+_FILE_HASH_LENGTH = 64
+
+
+class PredictionCache:
+    """Two-level cache of probability vectors keyed by image hash and model fingerprint.
+
+    A bounded in-memory LRU sits in front of the ``prediction_cache`` table in
+    the application database. Keys include the model fingerprint, so a new
+    ``model.h5`` never serves stale results; when a new fingerprint is seen the
+    memory layer is cleared and rows made from other model files are purged.
+    Rows for other variants of the same file are kept, since processes with
+    different backend or enhancement settings may share the database.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._model_fingerprint = None
+        self._lock = threading.Lock()
+
+    def _check_model(self, db, model_fingerprint):
+        """Drop everything cached for other model files when the model changes."""
+        with self._lock:
+            if model_fingerprint == self._model_fingerprint:
+                return
+            self._entries.clear()
+            self._model_fingerprint = model_fingerprint
+        db.purge_prediction_cache(model_fingerprint[:_FILE_HASH_LENGTH])
+
+    def _remember(self, key, probabilities):
+        with self._lock:
+            self._entries[key] = probabilities
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, db, image_hash, model_fingerprint):
+        """Return the cached probability vector, or None on a miss."""
+        self._check_model(db, model_fingerprint)
+        key = (image_hash, model_fingerprint)
+
+        with self._lock:
+            probabilities = self._entries.get(key)
+            if probabilities is not None:
+                self._entries.move_to_end(key)
+                return probabilities
+
+        blob = db.get_cached_prediction(image_hash, model_fingerprint)
+        if blob is None:
+            return None
+
+        probabilities = np.frombuffer(blob, dtype=np.float32)
+        self._remember(key, probabilities)
+        return probabilities
+
+    def put(self, db, image_hash, model_fingerprint, probabilities):
+        """Store a probability vector in memory and in the database."""
+        self._check_model(db, model_fingerprint)
+        probabilities = np.asarray(probabilities, dtype=np.float32).ravel()
+        self._remember((image_hash, model_fingerprint), probabilities)
+        db.cache_prediction(image_hash, model_fingerprint, probabilities.tobytes())
+
+    def clear(self):
+        """Empty the in-memory layer."""
+        with self._lock:
+            self._entries.clear()
+
+
+prediction_cache = PredictionCache()
@@ -0,0 +1,44 @@
+import os
+import copy
+import tomllib
+
+# Constants
+SERVING_CONFIG_PATH = os.environ.get('DR_SERVING_CONFIG', 'serving.toml')
+
+DEFAULT_SERVING_CONFIG = {
+    'inference': {
+        'mode': 'local',
+        'workers': 2,
+        'max_batch_size': 32,
+        'max_wait_ms': 5,
+        'request_timeout_s': 60,
+        'backend': 'keras',
+        'quantization': 'dynamic',
+        'calibration_dir': 'uploads',
+        'calibration_samples': 100,
+        'xla': False,
+    },
+    'preprocessing': {
+        'enhance': False,
+    },
+    'threading': {
+        'intra_op_threads': 0,
+        'inter_op_threads': 0,
+        'onednn': True,
+        'pin_workers': False,
+    },
+}
+
+
+def load_serving_config(path=SERVING_CONFIG_PATH):
+    """Load serving.toml on top of the defaults; a missing file means defaults."""
+    config = copy.deepcopy(DEFAULT_SERVING_CONFIG)
+    if not os.path.exists(path):
+        return config
+
+    with open(path, 'rb') as f:
+        overrides = tomllib.load(f)
+
+    for section, values in overrides.items():
+        config.setdefault(section, {}).update(values)
+    return config
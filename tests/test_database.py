@@ -0,0 +1,202 @@
+"""Schema migrations, scan summaries and History paging against throwaway SQLite files."""
+import random
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import db_module
+import db_module_1
+import migrations
+
+CLASS_NAMES = ['Mild', 'Moderate', 'Severe', 'Proliferative DR']
+
+
+def build_legacy_db(db_path, rows, users=5):
+    """Create a database in the old db_module layout with rows predictions."""
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            full_name TEXT,
+            created_at TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            image_path TEXT,
+            prediction_class TEXT,
+            confidence REAL,
+            created_at TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    rng = random.Random(0)
+    conn.executemany(
+        "INSERT INTO predictions (user_id, image_path, prediction_class, confidence, created_at) VALUES (?, ?, ?, ?, ?)",
+        [
+            (rng.randint(1, users), f"uploads/{i}.jpg", rng.choice(CLASS_NAMES), rng.random(),
+             f"2020-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}")
+            for i in range(rows)
+        ]
+    )
+    conn.commit()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+
+def summary_mismatches(conn):
+    """Return (user_id, class) groups where the summary table disagrees with predictions."""
+    return conn.execute('''
+        SELECT user_id, predicted_class FROM (
+            SELECT user_id, predicted_class, COUNT(*) AS n, MAX(timestamp) AS latest
+            FROM predictions GROUP BY user_id, predicted_class
+        ) AS p
+        FULL OUTER JOIN user_prediction_summary AS s USING (user_id, predicted_class)
+        WHERE p.n IS NOT s.scan_count OR p.latest IS NOT s.last_timestamp
+    ''').fetchall()
+
+@pytest.fixture
+def no_pause(monkeypatch):
+    monkeypatch.setattr(migrations, 'MIGRATION_BATCH_PAUSE_SECONDS', 0)
+
+
+def test_legacy_columns_are_renamed_in_place(tmp_path, no_pause):
+    db_path = str(tmp_path / 'legacy.db')
+    build_legacy_db(db_path, 50)
+
+    conn = sqlite3.connect(db_path)
+    assert migrations.migrate(conn, batch_size=7) == migrations.SCHEMA_VERSION
+    columns = migrations._columns(conn.cursor(), 'predictions')
+    assert {'predicted_class', 'timestamp', 'probabilities', 'model_version'} <= columns
+    assert not {'prediction_class', 'created_at'} & columns
+    assert conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] == 50
+    assert summary_mismatches(conn) == []
+
+def test_interrupted_migration_resumes_and_is_idempotent(tmp_path, no_pause, monkeypatch):
+    db_path = str(tmp_path / 'legacy.db')
+    build_legacy_db(db_path, 100)
+    conn = sqlite3.connect(db_path)
+
+    # Stop after the first backfill batch has been committed
+    def interrupt(seconds):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(migrations.time, 'sleep', interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        migrations.migrate(conn, batch_size=30)
+    assert migrations.get_schema_version(conn) == migrations.SCHEMA_VERSION - 1
+    assert conn.execute("SELECT last_id FROM migration_progress").fetchone()[0] == 30
+
+    monkeypatch.undo()
+    monkeypatch.setattr(migrations, 'MIGRATION_BATCH_PAUSE_SECONDS', 0)
+    assert migrations.migrate(conn, batch_size=30) == migrations.SCHEMA_VERSION
+    assert conn.execute("SELECT COUNT(*) FROM migration_progress").fetchone()[0] == 0
+    assert summary_mismatches(conn) == []
+
+    # Running again changes nothing
+    counts = conn.execute("SELECT * FROM user_prediction_summary ORDER BY 1, 2").fetchall()
+    assert migrations.migrate(conn, batch_size=30) == migrations.SCHEMA_VERSION
+    assert conn.execute("SELECT * FROM user_prediction_summary ORDER BY 1, 2").fetchall() == counts
+
+def test_summary_counts_concurrent_writes_during_backfill(tmp_path, monkeypatch):
+    monkeypatch.setattr(migrations, 'MIGRATION_BATCH_PAUSE_SECONDS', 0.002)
+    db_path = str(tmp_path / 'legacy.db')
+    build_legacy_db(db_path, 20000)
+    stop = threading.Event()
+    writes = []
+
+    def write():
+        # Writes like an application that knows nothing about the summary table
+        conn = sqlite3.connect(db_path, timeout=30)
+        rng = random.Random(1)
+        while not stop.is_set():
+            try:
+                if 'predicted_class' in migrations._columns(conn.cursor(), 'predictions'):
+                    conn.execute(
+                        "INSERT INTO predictions (user_id, image_path, predicted_class, confidence, timestamp) VALUES (?, ?, ?, ?, ?)",
+                        (rng.randint(1, 5), 'uploads/new.jpg', rng.choice(CLASS_NAMES), 0.5, '2021-01-01T00:00:00')
+                    )
+                    conn.execute("DELETE FROM predictions WHERE id = ?", (rng.randint(1, 20000),))
+                    conn.commit()
+                    writes.append(migrations.get_schema_version(conn))
+            except sqlite3.OperationalError:
+                # Raced the column rename
+                conn.rollback()
+            time.sleep(0.001)
+        conn.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        conn = sqlite3.connect(db_path, timeout=30)
+        migrations.migrate(conn, batch_size=500)
+        time.sleep(0.05)
+    finally:
+        stop.set()
+        writer.join()
+
+    # Some writes landed while the summary was still being backfilled
+    assert any(version < migrations.SCHEMA_VERSION for version in writes)
+    assert summary_mismatches(conn) == []
+
+def test_summary_follows_saves_and_deletes(tmp_path):
+    db = db_module_1.Database(str(tmp_path / 'app.db'))
+    db.create_user('alice', 'alice@example.com', 'secret')
+    user_id = db.authenticate_user('alice', 'secret')['id']
+
+    db.save_prediction(user_id, 'uploads/a.jpg', 'Mild', 0.9)
+    db.save_predictions(user_id, [('uploads/b.jpg', 'Severe', 0.8, None), ('uploads/c.jpg', 'Mild', 0.7, None)])
+    summary = db.get_user_summary(user_id)
+    assert summary['total_scans'] == 3
+    assert summary['class_counts'] == {'Mild': 2, 'Severe': 1}
+
+    severe = next(p for p in db.get_user_predictions(user_id) if p['predicted_class'] == 'Severe')
+    db.delete_prediction(severe['id'])
+    assert db.get_user_summary(user_id)['class_counts'] == {'Mild': 2}
+    with db.pool.connection() as conn:
+        assert summary_mismatches(conn) == []
+
+    db.delete_user(user_id)
+    assert db.get_user_summary(user_id)['total_scans'] == 0
+    assert db._fetchall("SELECT * FROM user_prediction_summary WHERE user_id = ?", (user_id,)) == []
+
+def test_keyset_pages_break_timestamp_ties_by_id(tmp_path):
+    db = db_module_1.Database(str(tmp_path / 'app.db'))
+    # One batch shares a single timestamp
+    db.save_predictions(1, [(f'uploads/{i}.jpg', 'Mild', 0.5, None) for i in range(7)])
+    db.save_prediction(1, 'uploads/latest.jpg', 'Severe', 0.5)
+    everything = db.get_user_predictions(1)
+
+    pages, after = [], None
+    while True:
+        page = db.get_user_predictions(1, after=after, limit=3)
+        if not page:
+            break
+        pages.extend(page)
+        after = (page[-1]['timestamp'], page[-1]['id'])
+
+    assert [p['id'] for p in pages] == [p['id'] for p in everything]
+    assert len({p['id'] for p in pages}) == 8
+
+def test_legacy_database_keeps_old_contract(tmp_path):
+    db_path = str(tmp_path / 'diabetic_retinopathy.db')
+    build_legacy_db(db_path, 3)
+    db = db_module.Database(db_path)
+
+    assert db.authenticate_user('admin', 'admin123') is None
+    user = db.create_user('bob', 'bob@example.com', 'secret')
+    assert user['username'] == 'bob'
+    with pytest.raises(Exception, match="Username already exists"):
+        db.create_user('bob', 'other@example.com', 'secret')
+
+    prediction = db.save_prediction(user['id'], 'uploads/x.jpg', 'Moderate', 0.6)
+    assert prediction['prediction_class'] == prediction['predicted_class'] == 'Moderate'
+    assert prediction['created_at'] == prediction['timestamp']
+    rows = db.get_user_predictions(user['id'])
+    assert [row['created_at'] for row in rows] == [prediction['created_at']]
+    assert db.get_user_summary(user['id'])['total_scans'] == 1
@@ -0,0 +1,128 @@
+import os
+import threading
+import numpy as np
+
+from model_registry import MODEL_PATH, import_tensorflow, build_placeholder_model
+from serving_config import load_serving_config
+from utils import preprocess_image, collect_image_paths, atomic_write_path, UPLOAD_FOLDER
+
+# Constants
+QUANTIZATION_MODES = ('dynamic', 'int8')
+CALIBRATION_SAMPLES = 100
+
+
+def get_tflite_path(model_path=MODEL_PATH, quantization='dynamic'):
+    """Return where the quantized copy of model_path is stored, e.g. model/model_dynamic.tflite."""
+    return f"{os.path.splitext(model_path)[0]}_{quantization}.tflite"
+
+def get_source_model_path(tflite_path):
+    """Inverse of get_tflite_path: return (keras model path, quantization mode)."""
+    root, quantization = os.path.splitext(tflite_path)[0].rsplit('_', 1)
+    return f"{root}.h5", quantization
+
+def get_serving_model_path(settings=None):
+    """Return the model file the configured backend serves from."""
+    settings = settings or load_serving_config()['inference']
+    if settings['backend'] == 'tflite':
+        return get_tflite_path(MODEL_PATH, settings['quantization'])
+    return MODEL_PATH
+
+def load_calibration_images(calibration_dir=UPLOAD_FOLDER, max_samples=CALIBRATION_SAMPLES):
+    """Preprocess up to max_samples images from calibration_dir, skipping unreadable files."""
+    images = []
+    for image_path in collect_image_paths([calibration_dir]):
+        try:
+            images.append(preprocess_image(image_path))
+        except Exception:
+            continue
+        if len(images) >= max_samples:
+            break
+    return images
+
+def convert_to_tflite(model_path=MODEL_PATH, quantization='dynamic', calibration_dir=UPLOAD_FOLDER,
+                      calibration_samples=CALIBRATION_SAMPLES, output_path=None):
+    """Convert a Keras model file to a quantized TFLite model and return its path.
+
+    dynamic: int8 weights, float activations; needs no calibration data.
+    int8: int8 weights and activations, calibrated on images from
+    calibration_dir; inputs and outputs stay float32 so callers are unchanged.
+    """
+    tf = import_tensorflow()
+
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {quantization}")
+
+    # Loaded here rather than through the registry, so the float model is
+    # freed once converted instead of staying cached for the process
+    if os.path.exists(model_path):
+        keras_model = tf.keras.models.load_model(model_path)
+    else:
+        keras_model = build_placeholder_model(model_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantization == 'int8':
+        calibration_images = load_calibration_images(calibration_dir, calibration_samples)
+        if not calibration_images:
+            raise ValueError(f"No calibration images found in {calibration_dir}")
+
+        converter.representative_dataset = lambda: ([image] for image in calibration_images)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    output_path = output_path or get_tflite_path(model_path, quantization)
+    flatbuffer = converter.convert()
+    del converter, keras_model
+    # Inference workers may convert concurrently
+    with atomic_write_path(output_path) as temp_path:
+        with open(temp_path, 'wb') as f:
+            f.write(flatbuffer)
+    return output_path
+
+def load_tflite_model(tflite_path, reconvert=False):
+    """Open tflite_path, converting it from its Keras model first if missing, out of date or reconvert is set."""
+    model_path, quantization = get_source_model_path(tflite_path)
+    if reconvert or not os.path.exists(tflite_path) or (
+            os.path.exists(model_path) and os.path.getmtime(tflite_path) < os.path.getmtime(model_path)):
+        settings = load_serving_config()['inference']
+        convert_to_tflite(model_path, quantization, settings['calibration_dir'],
+                          settings['calibration_samples'], output_path=tflite_path)
+    return TFLiteModel(tflite_path, num_threads=load_serving_config()['threading']['intra_op_threads'] or None)
+
+
+def _interpreter_class():
+    """Prefer the standalone LiteRT runtime, which avoids importing all of TensorFlow."""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        Interpreter = import_tensorflow().lite.Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """TFLite interpreter with a Keras-style predict().
+
+    The interpreter is not thread-safe, so calls are serialized. The input
+    tensor is resized when the batch size changes.
+    """
+
+    def __init__(self, tflite_path, num_threads=None):
+        self.tflite_path = tflite_path
+        self._interpreter = _interpreter_class()(model_path=tflite_path, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        self._lock = threading.Lock()
+
+    def predict(self, images, batch_size=None, verbose=0):
+        """Score a (N, H, W, 3) float32 array and return (N, num_classes) probabilities."""
+        images = np.asarray(images, dtype=np.float32)
+        with self._lock:
+            if images.shape[0] != self._batch_size:
+                self._interpreter.resize_tensor_input(self._input['index'], images.shape)
+                self._interpreter.allocate_tensors()
+                self._batch_size = images.shape[0]
+
+            self._interpreter.set_tensor(self._input['index'], images)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output['index']).copy()
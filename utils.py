@@ -1,56 +1,217 @@
+import io
 import os
 import uuid
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import cv2
 import numpy as np
-import tensorflow as tf
+import pandas as pd
 from PIL import Image
 from datetime import datetime
 import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
+
+from image_quality import field_of_view_box
 
 # Constants
 UPLOAD_FOLDER = 'uploads'
 IMAGE_SIZE = (150, 150)  # Must match the model's expected input size
+CLASS_NAMES = ['Mild', 'Moderate', 'Severe', 'Proliferative DR']
+THUMBNAIL_SIZE = (256, 256)
+PREVIEW_SIZE = (512, 512)
+THUMBNAIL_SUFFIX = '_thumb.jpg'
+ENHANCED_SIZE = (512, 512)
+ENHANCED_SUFFIX = '_enhanced.png'
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = (8, 8)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+HISTORY_MAX_POINTS = 500
 
-def save_uploaded_file(uploaded_file):
-    """Save the uploaded file to the uploads folder with a unique filename."""
-    # Create uploads directory if it doesn't exist
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
+# Persists uploads off the request path
+_upload_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-writer')
+
+def get_upload_path(digest, file_extension, folder=UPLOAD_FOLDER):
+    """Return the sharded storage path for a content hash, e.g. uploads/ab/cd/abcd....jpg."""
+    return os.path.join(folder, digest[:2], digest[2:4], f"{digest}{file_extension}")
+
+@contextmanager
+def atomic_write_path(path, keep_extension=False):
+    """Yield a unique temporary path beside path and move it over path once the block succeeds."""
+    # Readers never see a partial file, and concurrent writers of the same path never collide.
+    # The temporary name ends in .tmp so directory scans skip it, unless the
+    # writer needs the real extension to pick a format
+    if keep_extension:
+        root, extension = os.path.splitext(path)
+        temp_path = f"{root}.{uuid.uuid4().hex}.tmp{extension}"
+    else:
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def compute_content_hash(data):
+    """Return the SHA-256 hex digest of a bytes-like object."""
+    return hashlib.sha256(data).hexdigest()
+
+def _write_upload(data, file_path):
+    """Write upload bytes to file_path and make its thumbnail if missing."""
+    # Create shard directory if it doesn't exist
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
     
-    # Generate a unique filename
-    file_extension = os.path.splitext(uploaded_file.name)[1].lower()
-    unique_filename = f"{str(uuid.uuid4())}{file_extension}"
-    file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+    # Always write, even if the file exists: a concurrent delete of the last
+    # prediction using it may be removing it right now
+    with atomic_write_path(file_path) as temp_path:
+        with open(temp_path, "wb") as f:
+            f.write(data)
     
-    # Save the file
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    get_thumbnail(file_path)
     
     return file_path
 
-def preprocess_image(image_path):
-    """Preprocess the image for model prediction."""
-    # Load and resize image
-    img = Image.open(image_path)
+def save_uploaded_file(uploaded_file):
+    """Save the uploaded file under its SHA-256 content hash, so identical uploads share one file."""
+    data = uploaded_file.getbuffer()
+    file_extension = os.path.splitext(uploaded_file.name)[1].lower()
+    file_path = get_upload_path(compute_content_hash(data), file_extension)
+    return _write_upload(data, file_path)
+
+def save_uploaded_file_async(uploaded_file, digest=None):
+    """Return (file_path, future) for an upload at once; the future resolves when it is on disk."""
+    # getvalue() hands back the upload's own bytes object without copying
+    data = uploaded_file.getvalue()
+    if digest is None:
+        digest = compute_content_hash(data)
+    file_extension = os.path.splitext(uploaded_file.name)[1].lower()
+    file_path = get_upload_path(digest, file_extension)
+    return file_path, _upload_writer.submit(_write_upload, data, file_path)
+
+def restore_uploaded_file(uploaded_file, file_path):
+    """Write an upload again if a concurrent release removed it before its prediction was saved."""
+    if not os.path.exists(file_path):
+        _write_upload(uploaded_file.getvalue(), file_path)
+
+def load_uploaded_image(uploaded_file, size=PREVIEW_SIZE):
+    """Decode an upload from memory once, at preview resolution, for display and model input."""
+    return make_thumbnail_image(Image.open(io.BytesIO(uploaded_file.getvalue())), size)
+
+def release_uploaded_file(file_path, reference_count):
+    """Delete a stored upload once no prediction references it any more (see Database.release_image)."""
+    if reference_count > 0:
+        return False
+    
+    # Only ever remove files from the upload store
+    upload_root = os.path.abspath(UPLOAD_FOLDER)
+    if os.path.commonpath([upload_root, os.path.abspath(file_path)]) != upload_root:
+        return False
+    
+    # Thumbnail and cached enhancement share the upload's content hash
+    derived_paths = [get_thumbnail_path(file_path), get_enhanced_path(file_path)]
+    for derived_path in derived_paths:
+        try:
+            os.remove(derived_path)
+        except FileNotFoundError:
+            pass
+    
+    try:
+        os.remove(file_path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def make_thumbnail_image(img, size=THUMBNAIL_SIZE):
+    """Return a downscaled RGB copy of a PIL image that fits within size."""
+    # Let the JPEG decoder skip detail we are about to throw away
+    img.draft('RGB', size)
+    thumbnail = img.convert('RGB')
+    thumbnail.thumbnail(size)
+    return thumbnail
+
+def get_thumbnail_path(image_path):
+    """Return the path of the thumbnail stored beside an image."""
+    return f"{os.path.splitext(image_path)[0]}{THUMBNAIL_SUFFIX}"
+
+def create_thumbnail(image_path):
+    """Write a small JPEG thumbnail beside image_path and return its path."""
+    thumbnail_path = get_thumbnail_path(image_path)
+    try:
+        with Image.open(image_path) as img:
+            thumbnail = make_thumbnail_image(img)
+        
+        with atomic_write_path(thumbnail_path) as temp_path:
+            thumbnail.save(temp_path, format='JPEG', quality=85)
+        return thumbnail_path
+    except Exception as e:
+        print(f"Thumbnail error: {str(e)}")
+        return None
+
+def get_thumbnail(image_path):
+    """Return a thumbnail path for display, creating it on first use (or the image itself on failure)."""
+    thumbnail_path = get_thumbnail_path(image_path)
+    if os.path.exists(thumbnail_path):
+        return thumbnail_path
+    return create_thumbnail(image_path) or image_path
+
+def image_to_model_input(img, out=None):
+    """Resize and normalize an opened PIL image into a float32 (H, W, 3) array, in out if given."""
+    # Decode JPEGs at the smallest 1/2, 1/4 or 1/8 DCT scale that still covers
+    # IMAGE_SIZE; draft mode must be set before pixels are loaded
+    img.draft('RGB', IMAGE_SIZE)
+    
+    # Palette and other exotic modes need real colors before resampling
+    if img.mode not in ('RGB', 'L', 'RGBA'):
+        img = img.convert('RGB')
     img = img.resize(IMAGE_SIZE)
-    img_array = np.array(img)
     
-    # Convert to RGB if image is grayscale
-    if len(img_array.shape) == 2:
-        img_array = np.stack((img_array,) * 3, axis=-1)
+    # Grayscale is replicated and alpha dropped, as before
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
     
-    # Handle RGBA images (e.g., PNGs with transparency)
-    if img_array.shape[2] == 4:
-        img_array = img_array[:, :, :3]
+    if out is None:
+        out = np.empty((IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
     
-    # Normalize pixel values
-    img_array = img_array.astype(np.float32) / 255.0
+    # Normalize pixel values straight into the float32 buffer
+    np.divide(np.asarray(img), np.float32(255.0), out=out)
+    return out
+
+def preprocess_image(image_path, out=None):
+    """Preprocess the image for model prediction."""
+    with Image.open(image_path) as img:
+        if out is not None:
+            return image_to_model_input(img, out)
+        
+        # Add batch dimension
+        return image_to_model_input(img)[np.newaxis]
+
+def preprocess_images(image_paths):
+    """Preprocess several image paths or open files into a single (N, H, W, 3) batch."""
+    batch = np.empty((len(image_paths), IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+    for i, image_path in enumerate(image_paths):
+        preprocess_image(image_path, out=batch[i])
+    return batch
+
+def collect_image_paths(inputs, file_list=None):
+    """Expand files and directories (recursively) into a sorted list of image paths."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for name in files:
+                    # Skip the thumbnails and enhanced copies stored beside uploads
+                    if name.lower().endswith(IMAGE_EXTENSIONS) and not name.endswith((THUMBNAIL_SUFFIX, ENHANCED_SUFFIX)):
+                        paths.append(os.path.join(root, name))
+        else:
+            paths.append(item)
     
-    # Add batch dimension
-    img_array = np.expand_dims(img_array, axis=0)
+    if file_list:
+        with open(file_list, 'r') as f:
+            paths.extend(line.strip() for line in f if line.strip())
     
-    return img_array
+    return sorted(paths)
 
 def get_class_color(class_name):
     """Get color for class visualization."""
@@ -93,37 +254,59 @@ def plot_prediction_confidence(prediction, class_names):
     
     return fig
 
-def plot_prediction_history(predictions, class_names):
-    """Create a line chart showing prediction history over time."""
-    # Sort predictions by timestamp (oldest first)
-    sorted_preds = sorted(predictions, key=lambda x: x['timestamp'])
+def downsample_history(timestamps, severity, max_points=HISTORY_MAX_POINTS):
+    """Return sorted indices of at most max_points scans that keep the shape of a long history."""
+    count = len(timestamps)
+    if count <= max_points:
+        return np.arange(count)
+
+    # timestamps are sorted int64 nanoseconds. Each equal time bucket keeps its
+    # least and most severe scan, so brief changes survive, plus the first and last scan
+
+    buckets = max(1, (max_points - 2) // 2)
+    offsets = (timestamps - timestamps[0]).astype(np.float64)
+    bucket = np.minimum((offsets / max(offsets[-1], 1) * buckets).astype(np.int64), buckets - 1)
+
+    # Order by bucket, then severity; lexsort is stable, so ties keep time order
+    order = np.lexsort((severity, bucket))
+    ends = np.flatnonzero(np.diff(bucket[order])) + 1
+    lowest = order[np.concatenate(([0], ends))]
+    highest = order[np.concatenate((ends - 1, [count - 1]))]
+    return np.unique(np.concatenate(([0, count - 1], lowest, highest)))
+
+def plot_prediction_history(predictions, class_names, max_points=HISTORY_MAX_POINTS):
+    """Create a line chart showing prediction history over time, downsampled to max_points."""
+    history = pd.DataFrame.from_records(predictions, columns=['timestamp', 'predicted_class'])
+    timestamps = pd.to_datetime(history['timestamp'], format='ISO8601')
+    severity = pd.Categorical(history['predicted_class'], categories=class_names).codes
     
-    # Extract dates and classes
-    dates = [datetime.fromisoformat(pred['timestamp']) for pred in sorted_preds]
-    classes = [pred['predicted_class'] for pred in sorted_preds]
+    # Sort oldest first, skipping classes the chart has no level for
+    known = np.flatnonzero(severity >= 0)
+    known = known[np.argsort(timestamps.values[known], kind='stable')]
+    timestamps = timestamps.values[known]
+    severity = severity[known]
     
-    # Create figure
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    shown = downsample_history(timestamps.astype(np.int64), severity, max_points)
+    colors = np.array([get_class_color(class_name) for class_name in class_names])
     
-    # Add line chart for severity over time
-    severity_levels = {class_name: i for i, class_name in enumerate(class_names)}
-    severity_y = [severity_levels[cls] for cls in classes]
+    title = "Retinopathy Progression Over Time"
+    if len(shown) < len(known):
+        title += f" ({len(shown)} of {len(known)} scans shown)"
     
-    # Create mapping for y-axis ticks
-    severity_y_ticks = list(range(len(class_names)))
-    severity_y_ticktext = class_names
+    # Create figure
+    fig = go.Figure()
     
     # Add the line
     fig.add_trace(
         go.Scatter(
-            x=dates,
-            y=severity_y,
+            x=timestamps[shown],
+            y=severity[shown],
             mode='lines+markers',
             name='Severity Level',
             line=dict(color='#3498db', width=3),
             marker=dict(
                 size=10,
-                color=[get_class_color(cls) for cls in classes],
+                color=colors[severity[shown]],
                 line=dict(color='white', width=2)
             )
         )
@@ -131,15 +314,15 @@ def plot_prediction_history(predictions, class_names):
     
     # Update layout
     fig.update_layout(
-        title="Retinopathy Progression Over Time",
+        title=title,
         xaxis=dict(
             title="Date",
             tickformat="%b %d, %Y"
         ),
         yaxis=dict(
             title="Severity Level",
-            tickvals=severity_y_ticks,
-            ticktext=severity_y_ticktext
+            tickvals=list(range(len(class_names))),
+            ticktext=class_names
         ),
         plot_bgcolor='rgba(0,0,0,0)',
         height=400,
@@ -161,19 +344,82 @@ def generate_report(prediction, user_info):
     # Implementation depends on specific requirements
     pass
 
+def enhance_fundus_image(img):
+    """Return an enhanced RGB copy of a fundus photo, at most ENHANCED_SIZE."""
+    img = make_thumbnail_image(img, ENHANCED_SIZE)
+    box = field_of_view_box(img)
+    if box is not None:
+        img = img.crop(box)
+    rgb = np.array(img)
+    
+    # CLAHE on the green channel, where vessels and lesions have the most contrast
+    clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
+    rgb[..., 1] = clahe.apply(np.ascontiguousarray(rgb[..., 1]))
+    
+    # Ben Graham: 4 * (image - local average) + 128
+    height, width = rgb.shape[:2]
+    blurred = cv2.GaussianBlur(rgb, (0, 0), max(height, width) / 30)
+    rgb = cv2.addWeighted(rgb, 4, blurred, -4, 128)
+    
+    # The blur bleeds background into the rim, so blank it along with the outside
+    disc = np.zeros((height, width), dtype=np.uint8)
+    cv2.circle(disc, (width // 2, height // 2), int(max(height, width) / 2 * 0.95), 1, thickness=cv2.FILLED)
+    rgb[disc == 0] = 128
+    return Image.fromarray(rgb)
+
+def get_enhanced_path(image_path):
+    """Return the path of the enhanced copy stored beside an image."""
+    return f"{os.path.splitext(image_path)[0]}{ENHANCED_SUFFIX}"
+
+def _load_or_enhance(img, enhanced_path):
+    """Return the enhanced image stored at enhanced_path, enhancing img and storing it on a miss."""
+    if os.path.exists(enhanced_path):
+        with Image.open(enhanced_path) as enhanced:
+            return enhanced.convert('RGB')
+    
+    enhanced = enhance_fundus_image(img)
+    os.makedirs(os.path.dirname(enhanced_path), exist_ok=True)
+    with atomic_write_path(enhanced_path) as temp_path:
+        enhanced.save(temp_path, format='PNG')
+    return enhanced
+
+def get_enhanced_image(img, digest, cache_dir=UPLOAD_FOLDER):
+    """Return the enhanced image, cached on disk per content hash under cache_dir (None to skip the cache)."""
+    if cache_dir is None:
+        return enhance_fundus_image(img)
+    return _load_or_enhance(img, get_upload_path(digest, ENHANCED_SUFFIX, cache_dir))
+
 def apply_image_enhancements(image_path):
     """Apply image enhancements to improve quality for analysis."""
     try:
-        img = Image.open(image_path)
-        
-        # Apply some basic enhancements
-        # This is a placeholder - actual image processing would depend on specific requirements
-        
-        # Save enhanced image
-        enhanced_path = f"{os.path.splitext(image_path)[0]}_enhanced{os.path.splitext(image_path)[1]}"
-        img.save(enhanced_path)
-        
+        # Beside the image, where release_uploaded_file removes it; for hashed
+        # uploads this is the same file get_enhanced_image caches
+        enhanced_path = get_enhanced_path(image_path)
+        with Image.open(image_path) as img:
+            _load_or_enhance(img, enhanced_path)
         return enhanced_path
     except Exception as e:
         print(f"Image enhancement error: {str(e)}")
-        return image_path  # Return original if enhancement fails
\ No newline at end of file
+        return image_path  # Return original if enhancement fails
+
+
+class StageTimer:
+    """Accumulate wall-clock milliseconds per named pipeline stage (thread-safe)."""
+    
+    def __init__(self):
+        self.timings = {}
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.timings[name] = self.timings.get(name, 0.0) + elapsed
+    
+    def summary(self):
+        """Return e.g. 'quality check 4 ms · inference 12 ms' in stage order."""
+        return " · ".join(f"{name} {ms:.0f} ms" for name, ms in self.timings.items())
\ No newline at end of file